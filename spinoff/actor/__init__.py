@@ -4,9 +4,10 @@ from .node import Node
 # from .ref import Ref
 from .uri import Uri
 from .props import Props
+from .ref import ask_all, ask_first, ask_quorum
 from .exceptions import Unhandled
 from .spin import spin
 from .quick import actor, process
 
 
-__all__ = [Actor, spawn, Node, Uri, Props, Unhandled, spin, actor, process]
+__all__ = [Actor, spawn, Node, Uri, Props, Unhandled, spin, actor, process, ask_all, ask_first, ask_quorum]
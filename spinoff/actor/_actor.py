@@ -1,6 +1,7 @@
 # coding: utf-8
 from __future__ import print_function
 
+from spinoff.actor.mailbox import BLOCK
 from spinoff.actor.props import Props
 
 
@@ -24,6 +25,16 @@ class Actor(object):
 
     receive = run = None
 
+    # set to True if `receive` is known to block, so that it's always dispatched in a greenlet of its own
+    blocking = False
+    # how many messages to handle back-to-back before yielding to other greenlets; see also `Props.with_throughput`
+    throughput = 1
+    # the max number of regular messages the mailbox can hold, and what to do if it's full; see `Props.with_mailbox`
+    mailbox_capacity = None
+    mailbox_overflow = BLOCK
+    # the `Dispatcher` to run the actor on instead of a greenlet of its own; `None` means the default of the `Node`
+    dispatcher = None
+
     def spawn(self, factory, name=None):
         return self.__cell.spawn_actor(factory, name)
 
@@ -53,6 +64,11 @@ class Actor(object):
     def ref(self):
         return self.__cell.ref
 
+    @property
+    def mailbox(self):
+        """The `Mailbox` of this actor; `len(self.mailbox)` and `self.mailbox.high_water` give its current and peak depth."""
+        return self.__cell.mailbox
+
     @property
     def root(self):
         return self.__cell.root
@@ -71,7 +87,7 @@ class Actor(object):
         self.ref.send(*args, **kwargs)
 
     def send_later(self, *args, **kwargs):
-        self.ref.send_later(*args, **kwargs)
+        return self.ref.send_later(*args, **kwargs)
 
     def __lshift__(self, message):  # pragma: no cover
         self.ref.send(message)
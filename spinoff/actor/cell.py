@@ -17,6 +17,7 @@ from gevent.queue import Empty
 
 from spinoff.actor.events import Events, UnhandledMessage, DeadLetter, Error
 from spinoff.actor.exceptions import NameConflict, LookupFailed, Unhandled, UnhandledTermination
+from spinoff.actor.mailbox import Mailbox, _is_system, BLOCK
 from spinoff.actor.props import Props
 from spinoff.actor.ref import Ref
 from spinoff.actor.uri import Uri
@@ -27,8 +28,25 @@ from spinoff.util.pattern_matching import ANY
 _NOSENDER = None
 
 
+def _never():
+    return False
+
+
+def _factory_setting(factory, name, default):
+    return factory.setting(name) if isinstance(factory, Props) else getattr(factory, name, default)
+
+
+class _Interrupt(GreenletExit):
+    """Raised inside an inline `receive` that is blocked when the actor gets killed."""
+
+
+class _GetTimedOut(BaseException):
+    """Thrown by the node's timer wheel into a `run` waiting in `get(timeout=)` for too long."""
+
+
 class _BaseCell(object):
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     _children = {}  # XXX: should be a read-only dict
     child_name_gen = None
@@ -65,11 +83,19 @@ class _BaseCell(object):
             name = self._generate_name(factory)
             uri = self.uri / name
         assert name not in self._children  # XXX: ordering??
-        child = self._children[name] = Cell.spawn(parent_actor=self.ref, factory=factory, uri=uri, node=self.node).ref
+        dispatcher = _factory_setting(factory, 'dispatcher', None)
+        if dispatcher is None:
+            dispatcher = getattr(self.node, 'dispatcher', None)
+        if dispatcher is None:
+            cell = Cell.spawn(parent_actor=self.ref, factory=factory, uri=uri, node=self.node)
+        else:
+            cell = PooledCell.spawn(parent_actor=self.ref, factory=factory, uri=uri, node=self.node, dispatcher=dispatcher)
+        child = self._children[name] = cell.ref
+        self.node._cells[uri.path] = cell
         return child
 
     @abc.abstractmethod
-    def receive(self, message, _sender):
+    def receive(self, message, _sender, _may_block=True):
         pass
 
     def _generate_name(self, factory):
@@ -84,7 +110,8 @@ class _BaseCell(object):
         return self._children.values()
 
     def _child_gone(self, child):
-        self._children.pop(child.uri.name, None)
+        if self._children.pop(child.uri.name, None) is not None:
+            self.node._cells.pop(child.uri.path, None)
 
     def get_child(self, name):
         if not (name and isinstance(name, str)):
@@ -93,19 +120,14 @@ class _BaseCell(object):
 
     def lookup_cell(self, uri):
         """Looks up a local actor by its location relative to this actor."""
-        steps = uri.steps
-        if steps[0] == '':
-            found = self.root
-            steps.popleft()
-        else:
-            found = self
-        for step in steps:
-            assert step != ''
-            found = found.get_child(step)
-            if not found:
-                break
-            found = found._cell
-        return found
+        path = uri.path
+        if not path:
+            return self.root
+        if path[0] != '/':
+            path = self.uri.path + '/' + path
+        found = self.node._cells.get(path)
+        # a stopped actor stays in the index until its parent has processed its termination
+        return None if found is None or found.stopped else found
 
     def lookup_ref(self, uri):
         if not isinstance(uri, (Uri, str)):
@@ -118,135 +140,183 @@ class _BaseCell(object):
         return cell.ref
 
 
-class Cell(Greenlet, _BaseCell):
-    uri = None
-    node = None
-    actor = None
-    proc = None
-    stash = None
-    stopped = False
+# `_ActorCell` can't have slots of its own because `Cell` also inherits the instance layout of `Greenlet`
+_CELL_SLOTS = (
+    'factory', 'parent_actor', 'uri', 'node', 'actor', 'proc', 'stash', 'ch', 'get_pt', 'stopped', 'mailbox', 'inbox',
+    '_ref', '_children', 'child_name_gen', 'watchers', 'watchees', 'throughput', 'inline', '_dispatching', '_blocked',
+    'processing', '_stopping',
+)
 
-    inbox = None
-
-    _ref = None
-    child_name_gen = None
 
-    watchers = None
-    watchees = None
+class _ActorCell(_BaseCell):
+    """The part of an actor cell that doesn't depend on how the cell gets scheduled; see `Cell` and `PooledCell`."""
+    __slots__ = ()
 
     def __init__(self, parent_actor, factory, uri, node):
-        Greenlet.__init__(self)
         if not callable(factory):  # pragma: no cover
             raise TypeError("Provide a callable (such as a class, function or Props) as the factory of the new actor")
         self.factory = factory
         self.parent_actor = parent_actor
         self.uri = uri
         self.node = node
-        self.queue = gevent.queue.Queue()
-        self.inbox = deque()
+        self.actor = self.proc = self.stash = self._ref = None
+        self.stopped = False
+        self._children, self.child_name_gen = _BaseCell._children, None
+        self.watchers = self.watchees = None
+        self.throughput = 1
+        # receive() is dispatched inline in the cell greenlet until it's been seen to block
+        self.inline, self._dispatching, self._blocked = True, False, False
+        # while processing, a greenlet of its own is handling a message or running `run`, and regular messages wait
+        self.processing = self._stopping = False
+        self.mailbox = Mailbox(capacity=_factory_setting(factory, 'mailbox_capacity', None),
+                               overflow=_factory_setting(factory, 'mailbox_overflow', BLOCK))
+        self.inbox = self.mailbox.user
 
     @logstring(u'←')
-    def receive(self, message, _sender):
-        self.queue.put((_sender, message))
-
-    @logstring(u'↻')
-    def _run(self):
-        def _stop():
-            # dbg("STOP")
-            self.shutdown()
-            self.destroy()
-            gevent.getcurrent().kill()
-
+    def receive(self, message, _sender, _may_block=True):
+        if _is_system(message):
+            self.mailbox.put_system((_sender, message))
+        elif self.mailbox.put((_sender, message), self._may_block_sender if _may_block else _never):
+            Events.log(DeadLetter(self.ref, message, _sender))
+        if self._blocked and message == '_kill':
+            gevent.get_hub().loop.run_callback(self._interrupt)
+
+    def _may_block_sender(self):
+        # neither the hub nor the actor itself can wait for room in the mailbox
+        curr = gevent.getcurrent()
+        return not (curr is self or getattr(curr, '_cell', None) is self or curr is gevent.get_hub())
+
+    def switch_out(self):
+        # called by the gevent hub whenever the greenlet dispatching to this cell is about to block
+        if self._dispatching:
+            self._blocked = True
+
+    def _start(self):
+        """Constructs the actor; returns `False` if that failed, in which case the cell has already been stopped."""
         # dbg(u"►►")
         try:
             self.actor = self.construct()
         except Exception:
             self.report()
-            _stop()
-            return
-        processing = True if self.actor.run else False
-        stopped = False
-        while True:
-            # dbg("processing: %r, error: %r, suspended: %r, stash size: %s, active: %r" % (processing, error, suspended, len(self.stash) if self.stash is not None else '-'))
-            # consume the queue, handle system messages, and collect letters to the inbox
-            if processing or not self.inbox:
-                self.queue.peek()
-            while True:
-                try:
-                    sender, m = self.queue.get_nowait()
-                except gevent.queue.Empty:
-                    break
-                # dbg("@ CTRL:", m)
-                if m == '__done':
-                    processing = False
-                    if stopped:
-                        m = '_stop'  # fall thru to the _stop/_kill handler
-                    else:
-                        continue
-                elif m == '__undone':
-                    processing = True
+            self._stop()
+            return False
+        self.processing = True if self.actor.run else False
+        return True
+
+    def _stop(self):
+        # dbg("STOP")
+        self.shutdown()
+        self.destroy()
+
+    @property
+    def _has_letters(self):
+        """Whether there are regular messages that can be handled right away."""
+        return not self.processing and bool(self.inbox)
+
+    def _process(self):
+        """Handles all pending system messages, and then up to `throughput` regular messages.
+
+        The caller is expected to check `stopped` and `_has_letters` afterwards to find out whether to call it again
+        (after yielding to others) or to wait for more messages.
+
+        """
+        # dbg("processing: %r, stash size: %s" % (self.processing, len(self.stash) if self.stash is not None else '-'))
+        # handle the system messages first; while processing, letters just accumulate in the inbox
+        if self.mailbox.capacity is not None:
+            self.mailbox.release()
+        system = self.mailbox.system
+        while system:
+            sender, m = system.popleft()
+            # dbg("@ CTRL:", m)
+            if m == '__done':
+                self.processing = False
+                if self._stopping:
+                    m = '_stop'  # fall thru to the _stop/_kill handler
+                else:
                     continue
-                if m == ('__error', ANY, ANY):
-                    _, exc, tb = m
-                    self.report((exc, tb))
-                    _stop()
-                elif m in ('_kill', '_stop'):
-                    if m == '_kill':
-                        processing = False
-                    if not processing:
-                        if self.proc:
-                            self.proc.kill()
-                        _stop()
-                    else:
-                        stopped = True
-                elif m == ('_watched', ANY):
-                    self._watched(m[1])
-                elif m == ('_unwatched', ANY):
-                    self._unwatched(m[1])
+            elif m == '__undone':
+                self.processing = True
+                continue
+            if m == ('__error', ANY, ANY):
+                _, exc, tb = m
+                self.report((exc, tb))
+                self._stop()
+                return
+            elif m in ('_kill', '_stop'):
+                if m == '_kill':
+                    self.processing = False
+                if not self.processing:
+                    if self.proc:
+                        self.proc.kill()
+                    self._stop()
+                    return
+                else:
+                    self._stopping = True
+            elif m == ('_watched', ANY):
+                self._watched(m[1])
+            elif m == ('_unwatched', ANY):
+                self._unwatched(m[1])
+            elif m == ('_child_terminated', ANY):
+                self._child_gone(m[1])
+            elif m == ('_node_down', ANY):
+                _, node = m
+                self.inbox.extend((_NOSENDER, ('terminated', x)) for x in (self.watchees or []) if x.uri.node == node)
+        # process the normal letters (i.e. the regular, non-system/non-special messages)
+        inbox, handled = self.inbox, 0
+        while not self.processing and inbox and handled < self.throughput:
+            sender, m = inbox.popleft()
+            # dbg("@ NORMAL:", m)
+            if m == ('terminated', ANY):
+                _, actor = m
+                if self.watchees and actor in self.watchees:
+                    self.watchees.remove(actor)
+                    self._unwatch(actor, silent=True)
                 else:
-                    if m == ('_node_down', ANY):
-                        _, node = m
-                        self.inbox.extend((_NOSENDER, ('terminated', x)) for x in (self.watchees or []) if x.uri.node == node)
-                    else:
-                        self.inbox.append((sender, m))
-            # process the normal letters (i.e. the regular, non-system/non-special messages)
-            while not processing and self.queue.empty() and self.inbox:
-                sender, m = self.inbox.popleft()
-                # dbg("@ NORMAL:", m)
-                if m == ('terminated', ANY):
-                    _, actor = m
-                    if self.watchees and actor in self.watchees:
-                        self.watchees.remove(actor)
-                        self._unwatch(actor, silent=True)
-                    else:
-                        continue
-                elif m == ('_child_terminated', ANY):
-                    self._child_gone(m[1])
-                    break
-                self.actor.sender = sender
-                if self.actor.receive:
-                    processing = True
-                    self.proc = gevent.spawn(self.catch_exc, self.catch_unhandled, self.actor.receive, m, sender)
-                    self.proc._cell = self
-                elif self.actor.run:
-                    assert self.ch.balance == -1
-                    if self.get_pt == m:
-                        processing = True
-                        self.ch.put(m)
-                        self.inbox.extendleft(reversed(self.stash))
-                        self.stash.clear()
-                    else:
-                        self.stash.append((sender, m))
+                    continue
+            self.actor.sender = sender
+            if self.actor.receive:
+                if self.inline:
+                    self.dispatch_inline(m, sender)
+                    handled += 1
+                    if self.mailbox.system:
+                        break  # it has crashed or is stopping, or anything else that has to come before more letters
+                    continue
+                self.processing = True
+                self.proc = gevent.spawn(self.catch_exc, self.catch_unhandled, self.actor.receive, m, sender)
+                self.proc._cell = self
+            elif self.actor.run:
+                assert self.ch.balance == -1
+                if self.get_pt == m:
+                    self.processing = True
+                    self.ch.put(m)
+                    inbox.extendleft(reversed(self.stash))
+                    self.stash.clear()
                 else:
-                    self.catch_exc(self.unhandled, m, sender)
+                    self.stash.append((sender, m))
+            else:
+                self.catch_exc(self.unhandled, m, sender)
+
+    def dispatch_inline(self, m, sender):
+        """Runs `receive` directly in the cell greenlet; once it blocks, later messages get a greenlet of their own."""
+        self._dispatching = True
+        try:
+            self.catch_unhandled(self.actor.receive, m, sender)
+        except _Interrupt:
+            pass  # the '_kill' that caused it is still in the mailbox
+        except Exception:
+            self.mailbox.put_system((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
+        finally:
+            self._dispatching = False
+            if self._blocked:
+                self._blocked = self.inline = False
 
     def catch_exc(self, fn, *args, **kwargs):
         try:
             fn(*args, **kwargs)
         except Exception:
-            self.queue.put((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
+            self.mailbox.put_system((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
         else:
-            self.queue.put((_NOSENDER, '__done'))
+            self.mailbox.put_system((_NOSENDER, '__done'))
 
     def catch_unhandled(self, fn, m, sender):
         try:
@@ -259,12 +329,21 @@ class Cell(Greenlet, _BaseCell):
     def get(self, pattern=ANY, timeout=None):
         assert timeout is None or isinstance(timeout, (int, float))
         self.get_pt = pattern
-        self.queue.put((_NOSENDER, '__done'))
+        self.mailbox.put_system((_NOSENDER, '__done'))
+        timer = None
         try:
-            return self.ch.get(timeout=timeout)
-        except Empty:
-            self.queue.put((_NOSENDER, '__undone'))
-            raise
+            if timeout is None:
+                return self.ch.get()
+            elif timeout <= 0:
+                return self.ch.get(block=False)
+            timer = self.node.timers.call_later(timeout, gevent.getcurrent().throw, _GetTimedOut)
+            return self.ch.get()
+        except (Empty, _GetTimedOut):
+            self.mailbox.put_system((_NOSENDER, '__undone'))
+            raise Empty
+        finally:
+            if timer:
+                timer.cancel()
 
     def get_nowait(self, pattern):
         return self.get(pattern, timeout=0.0)
@@ -294,6 +373,9 @@ class Cell(Greenlet, _BaseCell):
             self.proc = gevent.spawn(self.wrap_run, actor.run)
             self.proc._cell = self
             self.stash = deque()
+        if actor.blocking:
+            self.inline = False
+        self.throughput = factory.setting('throughput') if isinstance(factory, Props) else actor.throughput
         return actor
 
     def wrap_run(self, fn):
@@ -302,12 +384,12 @@ class Cell(Greenlet, _BaseCell):
         except GreenletExit:
             ret = None
         except:
-            self.queue.put((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
+            self.mailbox.put_system((_NOSENDER, ('__error', sys.exc_info()[1], sys.exc_info()[2])))
             return
         if ret is not None:
             warnings.warn("Actor.run should not return anything--it's ignored")
-        self.queue.put((_NOSENDER, '__done'))
-        self.queue.put((_NOSENDER, '_stop'))
+        self.mailbox.put_system((_NOSENDER, '__done'))
+        self.mailbox.put_system((_NOSENDER, '_stop'))
 
     def shutdown(self, term_msg='_stop'):
         if hasattr(self.actor, 'post_stop'):
@@ -319,16 +401,15 @@ class Cell(Greenlet, _BaseCell):
             self._unwatch(self.watchees.pop())
         for child in self.children:
             child << term_msg
-        stash = deque()
-        self.queue.queue.extendleft(reversed(self.inbox))
-        self.inbox.clear()
+        system, stash = self.mailbox.system, deque()
         while self.children:
-            sender, m = self.queue.get()
+            self.mailbox.wait(user=False)
+            sender, m = system.popleft()
             if m == ('_child_terminated', ANY):
                 self._child_gone(m[1])
             else:
-                stash.appendleft((sender, m))
-        self.queue.queue.extendleft(stash)
+                stash.append((sender, m))
+        system.extendleft(reversed(stash))
 
     def destroy(self):
         if self._ref and self._ref():
@@ -339,22 +420,23 @@ class Cell(Greenlet, _BaseCell):
         else:
             self.stopped = True
             ref = self.ref
-        while True:
-            try:
-                sender, m = self.queue.get_nowait()
-            except gevent.queue.Empty:
-                break
+        self.mailbox.close()
+        system, user = self.mailbox.system, self.mailbox.user
+        while system:
+            sender, m = system.popleft()
             if m == ('_watched', ANY):
                 self._watched(m[1])
             elif m == ('__error', ANY, ANY):
                 _, exc, tb = m
                 self.report((exc, tb))
-            elif not (m == ('terminated', ANY) or m == ('_unwatched', ANY) or m == ('_node_down', ANY) or m == '_stop' or m == '_kill' or m == '__done' or m == '__undone'):
+        while user:
+            sender, m = user.popleft()
+            if not m == ('terminated', ANY):
                 Events.log(DeadLetter(ref, m, sender))
         self.parent_actor.send(('_child_terminated', ref))
         for watcher in (self.watchers or []):
             watcher << ('terminated', ref)
-        self.actor = self.inbox = self.queue = self.parent_actor = None
+        self.actor = self.inbox = self.mailbox = self.parent_actor = None
 
     def unhandled(self, m, sender):
         if ('terminated', ANY) == m:
@@ -440,9 +522,9 @@ class Cell(Greenlet, _BaseCell):
     #     return {'--\\': self.shutting_down, '+': self.stopped, 'N': not self.started, '_': self.suspended, '?': self.tainted, 'X': self.processing_messages, }
 
     # def logcomment(self):  # pragma: no cover
-    #     if not self.queue.empty() or self.inbox:
+    #     if not self.mailbox.empty():
     #         def g():
-    #             for i, msg in enumerate(chain(self.inbox, [' ... '], self.queue.queue)):
+    #             for i, msg in enumerate(chain(self.mailbox.system, [' ... '], self.inbox)):
     #                 yield msg if isinstance(msg, str) else repr(msg)
     #                 if i == 2:
     #                     yield '...'
@@ -453,3 +535,69 @@ class Cell(Greenlet, _BaseCell):
 
     def __repr__(self):
         return "<cell:%s>" % (self.uri.path,)
+
+
+class Cell(_ActorCell, Greenlet):
+    """A cell that is a greenlet of its own, parked in its mailbox whenever it has nothing to do."""
+    __slots__ = _CELL_SLOTS
+
+    def __init__(self, parent_actor, factory, uri, node):
+        Greenlet.__init__(self)
+        _ActorCell.__init__(self, parent_actor, factory, uri, node)
+
+    def _interrupt(self):
+        if self._blocked:
+            self.throw(_Interrupt)
+
+    @logstring(u'↻')
+    def _run(self):
+        if not self._start():
+            return
+        while True:
+            if self._has_letters:
+                gevent.sleep(0)  # a batch was cut short by `throughput`; let others run
+            else:
+                self.mailbox.wait(user=not self.processing)
+            self._process()
+            if self.stopped:
+                return
+
+
+class PooledCell(_ActorCell):
+    """A cell that is a plain object, run by one of the worker greenlets of a `Dispatcher` whenever it has mail."""
+    __slots__ = _CELL_SLOTS + ('dispatcher', '_worker', '_started', '__weakref__')
+
+    def __init__(self, parent_actor, factory, uri, node, dispatcher):
+        _ActorCell.__init__(self, parent_actor, factory, uri, node)
+        self.dispatcher = dispatcher
+        self._worker = None  # the worker greenlet currently running this cell, if any
+        self._started = False
+
+    @classmethod
+    def spawn(cls, *args, **kwargs):
+        cell = cls(*args, **kwargs)
+        cell.dispatcher.schedule(cell)
+        return cell
+
+    def switch(self, _):
+        # called (as if this were a `Waiter`) by the mailbox once there is something to handle
+        self.dispatcher.schedule(self)
+
+    def _interrupt(self):
+        if self._blocked:
+            self._worker.throw(_Interrupt)
+
+    @logstring(u'↻')
+    def run_step(self):
+        """Called by a worker of `dispatcher` each time this cell has been scheduled."""
+        if not self._started:
+            self._started = True
+            if not self._start():
+                return
+        self._process()
+        if self.stopped:
+            return
+        if self._has_letters:
+            self.dispatcher.schedule(self)  # a batch was cut short by `throughput`; go to the back of the queue
+        else:
+            self.mailbox.wait_async(self, user=not self.processing)
@@ -20,6 +20,8 @@ def get_context():
 
 
 class Context(object):
+    __slots__ = ('spawn', 'sender', 'node', 'ref')
+
     def __init__(self, cell):
         self.spawn = cell.spawn_actor
         self.sender = cell.actor.sender if cell.actor else None
@@ -0,0 +1,104 @@
+# coding: utf-8
+from __future__ import print_function
+
+from collections import deque
+
+import gevent
+from gevent import Greenlet
+from gevent.hub import Waiter, get_hub
+
+
+class Dispatcher(object):
+    """Runs actors on a fixed-size pool of worker greenlets instead of giving each actor a greenlet of its own.
+
+    An idle actor is then just a plain object waiting for mail, which makes it possible to hold a very large number of
+    mostly-idle actors in memory. Use it for all actors of a node with `Node(dispatcher=Dispatcher())`, or for
+    individual actors with `Props.with_dispatcher`.
+
+    Workers are started on demand: whenever there is mail but all workers are blocked in the middle of handling a
+    message, e.g. because `receive` is waiting for a reply, another worker is started, so that one actor blocking never
+    holds up the others. Once the blocked workers are done, the pool shrinks back to at most `size` workers.
+
+    """
+    def __init__(self, size=4):
+        if not isinstance(size, int) or size < 1:
+            raise TypeError("dispatcher size should be a positive int, not %r" % (size,))
+        self.size = size
+        self.ready = deque()  # cells that have something to handle
+        self._idle = deque()  # waiters of the workers waiting for cells to become ready
+        self._running = 0  # workers that are not blocked in the middle of running a cell
+
+    def schedule(self, cell):
+        self.ready.append(cell)
+        if self._idle:
+            get_hub().loop.run_callback(self._idle.popleft().switch, None)
+        elif not self._running:
+            self._start_worker()
+
+    def _start_worker(self):
+        self._running += 1
+        _Worker.spawn(self)
+
+    def _worker_blocked(self):
+        self._running -= 1
+        if self.ready and not self._idle and not self._running:
+            self._start_worker()
+
+    def _worker_unblocked(self):
+        """Returns `True` if the worker should retire because enough others were started while it was blocked."""
+        if self._running >= self.size:
+            return True
+        self._running += 1
+        return False
+
+    def _wait(self):
+        waiter = Waiter()
+        self._idle.append(waiter)
+        waiter.get()
+
+    def __repr__(self):
+        return '<dispatcher:%d/%d>' % (self._running, self.size)
+
+
+class _Worker(Greenlet):
+    _cell = None  # the cell currently being run; also makes `get_context()` work inside the actor
+    blocked = False
+
+    def __init__(self, dispatcher):
+        Greenlet.__init__(self)
+        self.dispatcher = dispatcher
+
+    def switch_out(self):
+        # called by the gevent hub whenever this greenlet is about to block
+        cell = self._cell
+        if cell is not None:
+            cell.switch_out()
+            if not self.blocked:
+                self.blocked = True
+                self.dispatcher._worker_blocked()
+
+    def _run(self):
+        dispatcher = self.dispatcher
+        ready = dispatcher.ready
+        try:
+            while True:
+                if not ready:
+                    dispatcher._wait()
+                # run each of the currently ready cells once, then let others run
+                for _ in xrange(len(ready)):
+                    if not ready:
+                        break
+                    cell = ready.popleft()
+                    self._cell, cell._worker = cell, self
+                    try:
+                        cell.run_step()
+                    finally:
+                        self._cell = cell._worker = cell = None
+                    if self.blocked:
+                        if dispatcher._worker_unblocked():
+                            return
+                        self.blocked = False
+                gevent.sleep(0)
+        finally:
+            if not self.blocked:
+                dispatcher._running -= 1
@@ -14,3 +14,7 @@ class UnhandledTermination(Exception):
 
 class LookupFailed(RuntimeError):
     pass
+
+
+class NoQuorum(Exception):
+    pass
@@ -61,7 +61,8 @@ class Guardian(_BaseCell, _BaseRef):
                     _sender = context.ref
             Events.log(UnhandledMessage(self, message, _sender))
 
-    receive = send
+    def receive(self, message, _sender, _may_block=True):
+        return self.send(message, _sender)
 
     def _do_stop(self, kill=False):
         if self.children:
@@ -0,0 +1,134 @@
+# coding: utf-8
+from __future__ import print_function
+
+from collections import deque
+
+from gevent.hub import Waiter, get_hub
+
+from spinoff.util.python import enumrange
+
+
+# what to do with a regular message sent to a mailbox that is full:
+BLOCK, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER = enumrange('BLOCK', 'DROP_NEWEST', 'DROP_OLDEST', 'DEAD_LETTER')
+
+_SYSTEM_MESSAGES = frozenset(['_stop', '_kill', '__done', '__undone'])
+_SYSTEM_TUPLES = {'_watched': 2, '_unwatched': 2, '_node_down': 2, '_child_terminated': 2, '__error': 3}
+
+
+def _is_system(message):
+    """Returns `True` if `message` is a control message that should bypass the regular (user) messages."""
+    t = type(message)
+    if t is tuple:
+        return bool(message) and type(message[0]) is str and _SYSTEM_TUPLES.get(message[0]) == len(message)
+    return t is str and message in _SYSTEM_MESSAGES
+
+
+class Mailbox(object):
+    """Two-lane mailbox of an actor.
+
+    System messages go to the `system` lane, which the owner always handles before anything in the `user` lane, so
+    that control messages never have to wait behind (or be compared against) a backlog of regular messages. Both lanes
+    are plain `deque`s of `(sender, message)` pairs; the owning greenlet pops from them directly.
+
+    The `user` lane can be bounded by `capacity`, in which case `overflow` decides what happens to messages that don't
+    fit: `BLOCK` makes the sender wait until the owner calls `release`, `DROP_NEWEST` and `DROP_OLDEST` discard a
+    message, and `DEAD_LETTER` hands the new message back to the caller of `put` to be reported as a dead letter. System
+    messages are never subject to the capacity.
+
+    """
+    __slots__ = ('system', 'user', 'capacity', 'overflow', 'closed', 'high_water', 'dropped', '_waiter', '_wait_for_user',
+                 '_putters')
+
+    def __init__(self, capacity=None, overflow=BLOCK):
+        self.system = deque()
+        self.user = deque()
+        self.capacity, self.overflow = capacity, overflow
+        self.closed = False
+        self.high_water = 0  # the highest number of messages ever in the `user` lane
+        self.dropped = 0  # the number of messages discarded (or handed back from `put`) because of overflow
+        self._waiter, self._wait_for_user = None, True
+        self._putters = deque() if capacity is not None else None
+
+    def put(self, item, may_block=lambda: True):
+        """Adds a regular message; returns the item that didn't fit and must be dead-lettered, if any.
+
+        `may_block` is consulted when the mailbox is full and `overflow` is `BLOCK`; if it returns `False`, the item is
+        not waited on but handed back instead.
+
+        """
+        user = self.user
+        if self.capacity is not None and len(user) >= self.capacity:
+            return self._overflow(item, may_block)
+        user.append(item)
+        if len(user) > self.high_water:
+            self.high_water = len(user)
+        if self._waiter is not None and self._wait_for_user:
+            self._notify()
+
+    def put_system(self, item):
+        self.system.append(item)
+        if self._waiter is not None:
+            self._notify()
+
+    def wait(self, user=True):
+        """Blocks until there is a system message, or, if `user` is true, any message at all."""
+        if self.system or user and self.user:
+            return
+        self._waiter, self._wait_for_user = Waiter(), user
+        try:
+            self._waiter.get()
+        finally:
+            self._waiter = None
+
+    def wait_async(self, waiter, user=True):
+        """Like `wait` but instead of blocking, arranges for `waiter.switch(None)` to be called from the hub."""
+        self._waiter, self._wait_for_user = waiter, user
+        if self.system or user and self.user:
+            self._notify()
+
+    def release(self):
+        """Wakes up as many senders blocked on a full mailbox as there is room for."""
+        putters, room = self._putters, self.capacity - len(self.user)
+        while putters and room > 0:
+            get_hub().loop.run_callback(putters.popleft().switch, None)
+            room -= 1
+
+    def close(self):
+        """Wakes up all blocked senders and makes any further `put` hand its item back."""
+        self.closed = True
+        if self.capacity is not None:
+            while self._putters:
+                get_hub().loop.run_callback(self._putters.popleft().switch, None)
+
+    def empty(self):
+        return not self.system and not self.user
+
+    def __len__(self):
+        return len(self.system) + len(self.user)
+
+    def _overflow(self, item, may_block):
+        if self.closed:
+            return item
+        overflow = self.overflow
+        if overflow is BLOCK and may_block():
+            waiter = Waiter()
+            self._putters.append(waiter)
+            try:
+                waiter.get()
+            finally:
+                if waiter in self._putters:
+                    self._putters.remove(waiter)
+            return item if self.closed else self.put(item, may_block)
+        self.dropped += 1
+        if overflow is DROP_OLDEST:
+            self.user.popleft()
+            self.user.append(item)
+        elif overflow is not DROP_NEWEST:
+            return item
+
+    def _notify(self):
+        waiter, self._waiter = self._waiter, None
+        get_hub().loop.run_callback(waiter.switch, None)
+
+    def __repr__(self):
+        return '<mailbox:%d+%d>' % (len(self.system), len(self.user))
@@ -1,16 +1,17 @@
 # coding: utf-8
 from __future__ import print_function
 
-from cPickle import dumps, PicklingError
-from cStringIO import StringIO
+from cPickle import PicklingError
 
 from spinoff.actor.events import Events, DeadLetter
 from spinoff.actor.exceptions import LookupFailed
 from spinoff.actor.guardian import Guardian
 from spinoff.actor.ref import Ref
+from spinoff.actor.timers import TimerWheel
 from spinoff.actor.uri import Uri
-from spinoff.remoting import Hub, HubWithNoRemoting
-from spinoff.remoting.pickler import IncomingMessageUnpickler
+from spinoff.remoting import Hub, HubWithNoRemoting, LoopbackHub
+from spinoff.remoting.codec import LegacyPickleCodec, UnknownPath
+from spinoff.remoting.pickler import deepcopy
 from spinoff.util.pattern_matching import ANY
 from spinoff.util.logging import err
 
@@ -21,15 +22,25 @@ class Node(object):
     were a class, i.e. using it as a class. This is mainly useful for testing multi-node scenarios without any network
     involved by setting a custom `remoting.Hub` to the `Node`.
 
+    With `loopback`, the node only talks to other loopback nodes in the same process, through a `remoting.LoopbackHub`,
+    which hands messages over as copies instead of serializing them.
+
     """
     _hub = None
 
-    def __init__(self, nid=None, enable_remoting=False, enable_relay=False, hub_kwargs={}):
+    def __init__(self, nid=None, enable_remoting=False, enable_relay=False, hub_kwargs={}, dispatcher=None,
+                 codec=None, loopback=False):
         self.nid = nid
+        # the codec that every node can decode, until all of them can decode `BinaryCodec`; see `spinoff.remoting.codec`
+        self.codec = codec or LegacyPickleCodec()
+        self.dispatcher = dispatcher  # see `spinoff.actor.dispatcher.Dispatcher`
+        self._cells = {}  # path => cell of every local actor, for looking them up without walking the hierarchy
+        self.timers = TimerWheel()  # backs `send_later` and `get(timeout=)` of the actors of this node
         self._uri = Uri(name=None, parent=None, node=nid)
         self.guardian = Guardian(uri=self._uri, node=self)
         self._hub = (
             HubWithNoRemoting() if not enable_remoting else
+            LoopbackHub(nid, on_node_down=lambda ref, nid: ref << ('_node_down', nid), on_receive=self._on_receive, on_deliver=self._on_deliver, **hub_kwargs) if loopback else
             Hub(nid, enable_relay, on_node_down=lambda ref, nid: ref << ('_node_down', nid), on_receive=self._on_receive, **hub_kwargs)
         )
 
@@ -58,7 +69,7 @@ class Node(object):
         return self.guardian.spawn_actor(*args, **kwargs)
 
     def send_message(self, message, remote_ref, sender):
-        self._hub.send_message(remote_ref.uri.node, _Msg(remote_ref, message, sender))
+        self._hub.send_message(remote_ref.uri.node, _Msg(remote_ref, message, sender, self.codec))
 
     def watch_node(self, nid, watcher):
         self._hub.watch_node(nid, watcher)
@@ -66,10 +77,11 @@ class Node(object):
     def unwatch_node(self, nid, watcher):
         self._hub.unwatch_node(nid, watcher)
 
-    def _on_receive(self, sender_nid, msg_bytes):
-        pickler = IncomingMessageUnpickler(self, StringIO(msg_bytes))
+    def _on_receive(self, sender_nid, msg_bytes, buffers=(), paths=None):
         try:
-            loaded = pickler.load()
+            loaded = self.codec.decode(self, msg_bytes, buffers, paths)
+        except UnknownPath:
+            raise  # the hub will have the sender start over with its paths
         except Exception:
             return  # malformed input
 
@@ -77,7 +89,19 @@ class Node(object):
             local_path, message, sender = loaded
         except Exception:
             return  # malformed input
-
+        self._deliver(local_path, message, sender)
+
+    def _on_deliver(self, sender_nid, msg_h, copy=True):
+        # from another node in the same process; see `LoopbackHub`
+        if not self.guardian:  # stopping
+            msg_h.send_failed()
+            return
+        message, sender = msg_h.msg, msg_h.sender
+        if copy:
+            message, sender = deepcopy(self, (message, sender))
+        self._deliver(msg_h.ref.uri.path, message, sender)
+
+    def _deliver(self, local_path, message, sender):
         cell = self.guardian.lookup_cell(Uri.parse(local_path))
         if not cell:
             if ('_watched', ANY) == message:
@@ -89,7 +113,8 @@ class Node(object):
             else:
                 self._remote_dead_letter(local_path, message, sender)
         else:
-            cell.receive(message, sender)
+            # a full mailbox must not hold up the delivery of messages to other actors
+            cell.receive(message, sender, _may_block=False)
 
     def _remote_dead_letter(self, path, msg, sender):
         ref = Ref(cell=None, uri=Uri.parse(self.nid + path), node=self, is_local=True)
@@ -100,6 +125,8 @@ class Node(object):
         if getattr(self, 'guardian', None):
             self.guardian.stop()
             self.guardian = None
+        if getattr(self, 'timers', None):
+            self.timers.stop()
         if getattr(self, '_hub', None):
             self._hub.stop()
             self._hub = None
@@ -116,11 +143,13 @@ class Node(object):
 
 
 class _Msg(object):
-    def __init__(self, ref, msg, sender):
-        self.ref, self.msg, self.sender = ref, msg, sender
+    __slots__ = ('ref', 'msg', 'sender', 'codec')
+
+    def __init__(self, ref, msg, sender, codec):
+        self.ref, self.msg, self.sender, self.codec = ref, msg, sender, codec
 
-    def serialize(self):
-        return dumps((self.ref.uri.path, self.msg, self.sender), protocol=2)
+    def serialize(self, buffers=None, paths=None):
+        return self.codec.encode(self.ref.uri.path, self.msg, self.sender, buffers, paths)
 
     def send_failed(self):
         if not (self.msg == ('_unwatched', ANY) or self.msg == ('_watched', ANY)):
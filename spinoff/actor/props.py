@@ -3,13 +3,22 @@ from __future__ import print_function
 
 import inspect
 
+from spinoff.actor.dispatcher import Dispatcher
+from spinoff.actor.mailbox import BLOCK, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER
+
+
+_NO_SETTINGS = {}  # shared by all `Props` without settings; never modified, `_with` always makes a new dict
+
 
 # TODO: rename to _UnspawnedActor
 class Props(object):
+    __slots__ = ('cls', 'args', 'kwargs', 'settings')
+
     def __init__(self, cls, *args, **kwargs):
         if hasattr(inspect, 'getcallargs'):
             inspect.getcallargs(cls.__init__, None, *args, **kwargs)
         self.cls, self.args, self.kwargs = cls, args, kwargs
+        self.settings = _NO_SETTINGS
 
     def __call__(self):
         return self.cls(*self.args, **self.kwargs)
@@ -17,7 +26,50 @@ class Props(object):
     def using(self, *args, **kwargs):
         args = self.args + args
         kwargs.update(self.kwargs)
-        return Props(self.cls, *args, **kwargs)
+        return Props(self.cls, *args, **kwargs)._with(**self.settings)
+
+    def with_throughput(self, throughput):
+        """Returns a copy of these `Props` whose actor handles up to `throughput` messages before yielding to others.
+
+        Overrides `Actor.throughput` of the actor class.
+
+        """
+        if not isinstance(throughput, int) or throughput < 1:
+            raise TypeError("throughput should be a positive int, not %r" % (throughput,))
+        return self._with(throughput=throughput)
+
+    def with_mailbox(self, capacity, overflow=BLOCK):
+        """Returns a copy of these `Props` whose actor's mailbox holds at most `capacity` regular messages.
+
+        `overflow` is one of `BLOCK`, `DROP_NEWEST`, `DROP_OLDEST` and `DEAD_LETTER` from `spinoff.actor.mailbox`.
+        Overrides `Actor.mailbox_capacity` and `Actor.mailbox_overflow` of the actor class.
+
+        """
+        if not isinstance(capacity, int) or capacity < 1:
+            raise TypeError("mailbox capacity should be a positive int, not %r" % (capacity,))
+        if overflow not in (BLOCK, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER):
+            raise TypeError("unknown mailbox overflow policy: %r" % (overflow,))
+        return self._with(mailbox_capacity=capacity, mailbox_overflow=overflow)
+
+    def with_dispatcher(self, dispatcher):
+        """Returns a copy of these `Props` whose actor is run by `dispatcher` instead of a greenlet of its own.
+
+        Overrides `Actor.dispatcher` of the actor class and the dispatcher of the `Node`.
+
+        """
+        if not isinstance(dispatcher, Dispatcher):
+            raise TypeError("expected a Dispatcher, not %r" % (dispatcher,))
+        return self._with(dispatcher=dispatcher)
+
+    def setting(self, name):
+        """Returns the value of the setting `name` as overridden by these `Props`, or as defined by the actor class."""
+        return self.settings[name] if name in self.settings else getattr(self.cls, name)
+
+    def _with(self, **settings):
+        ret = Props.__new__(Props)
+        ret.cls, ret.args, ret.kwargs = self.cls, self.args, self.kwargs
+        ret.settings = dict(self.settings, **settings)
+        return ret
 
     def __repr__(self):
         args = ', '.join(repr(x) for x in self.args)
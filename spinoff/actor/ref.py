@@ -2,13 +2,18 @@
 from __future__ import print_function
 
 import abc
+from functools import partial
+from itertools import count
 
-from gevent import getcurrent, spawn_later
+from gevent import getcurrent
+from gevent.event import AsyncResult
 
 from spinoff.actor.events import Events, DeadLetter
+from spinoff.actor.exceptions import NoQuorum
+from spinoff.actor.mailbox import _is_system
 from spinoff.actor.uri import Uri
-from spinoff.actor.misc import TempActor
 from spinoff.actor.context import get_context, _get_cell
+from spinoff.actor.timers import default_wheel
 from spinoff.util.pattern_matching import ANY, IN, Matcher
 from spinoff.util.logging import dbg
 
@@ -16,6 +21,7 @@ from spinoff.util.logging import dbg
 class _BaseRef(object):
     """Internal abstract class for all objects that behave like actor references."""
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     @abc.abstractproperty
     def is_local(self):
@@ -54,9 +60,19 @@ class _BaseRef(object):
         return self
 
     def ask(self, msg, timeout=None):
-        tmp, d = TempActor.make()
-        self.send(msg, _sender=tmp)
-        return d.get(timeout=timeout)
+        """Sends `msg` to this actor and waits for the first message sent back to the sender of `msg`.
+
+        Raises `gevent.Timeout` if no reply arrives in `timeout` seconds; a later reply goes to dead letters.
+
+        """
+        context = get_context()
+        result = AsyncResult()
+        promise = _Promise(context.node if context else self.node, partial(_resolve, result))
+        try:
+            self.send(msg, _sender=promise.ref)
+            return result.get(timeout=timeout)
+        finally:
+            promise.close()
 
     def forward(self, msg):
         sender = get_context().sender
@@ -64,7 +80,10 @@ class _BaseRef(object):
         self.send(msg, _sender=sender)
 
     def send_later(self, delay, message, _sender=None):
-        spawn_later(delay, self.send, message, _sender=_sender or get_context().ref)
+        """Sends `message` to this actor in `delay` seconds; returns a `Timer` whose `cancel()` prevents that."""
+        context = get_context()
+        node = context.node if context else self.node
+        return (node.timers if node else default_wheel()).call_later(delay, self.send, message, _sender=_sender or context.ref)
 
     def stop(self):
         """Sends '_stop' to this actor"""
@@ -119,14 +138,10 @@ class Ref(_BaseRef):
 
     """
 
-    _cell = None
-
     # XXX: should be is_resolved with perhaps is_local being None while is_resolved is False
     # Ref constructor should set is_resolved=False by default, but that requires is_dead for creating dead refs, because
     # currently dead refs are just Refs with no cell and is_local=True
-    is_local = True
-    uri = None
-    node = None
+    __slots__ = ('_cell', 'uri', 'node', 'is_local', '__weakref__')
 
     def __init__(self, cell, uri, node, is_local=True):
         assert is_local or not cell
@@ -207,9 +222,161 @@ class Ref(_BaseRef):
         return str(self.uri)  # if self.is_local else (str(self.uri), self.node)
 
     def __setstate__(self, uri):
-        # if it's a tuple, it's a remote `Ref` and the tuple origates from IncomingMessageUnpickler,
-        # otherwise it must be just a local `Ref` being pickled and unpickled for whatever reason:
-        if isinstance(uri, tuple):
-            self.is_local = False
-            uri, self.node = uri
+        # refs sent to other nodes are pickled by `spinoff.remoting.pickler` instead, so this must be just a local `Ref`
+        # being pickled and unpickled for whatever reason:
+        self._cell, self.node, self.is_local = None, None, True
         self.uri = Uri.parse(uri)
+
+    def __deepcopy__(self, memo):
+        # a copy of a ref points to the same actor, so it's the same ref, except when `spinoff.remoting.pickler.deepcopy`
+        # copies a message for another node, which the copy then has to be attached to
+        load_ref = memo.get(REF_LOADER)
+        return load_ref(str(self.uri)) if load_ref else self
+
+
+# the key in the memo of `copy.deepcopy` of the function that turns the URIs of the refs being copied back into refs
+REF_LOADER = 'spinoff.ref_loader'
+
+
+def ask_all(refs, message, timeout=None):
+    """Sends `message` to all of `refs` and returns all of their replies, in the order of `refs`.
+
+    Raises the first exception that is sent back instead of a reply, and `gevent.Timeout` if not all of the replies
+    arrive in `timeout` seconds.
+
+    """
+    replies, missing = [None] * len(refs), [len(refs)]
+
+    def on_reply(result, i, reply):
+        if isinstance(reply, BaseException):
+            result.set_exception(reply)
+        else:
+            replies[i] = reply
+            missing[0] -= 1
+            if not missing[0]:
+                result.set(replies)
+    return _scatter(refs, message, timeout, on_reply) if refs else []
+
+
+def ask_first(refs, message, n=1, timeout=None):
+    """Sends `message` to all of `refs` and returns a list of the first `n` replies, in the order they arrive.
+
+    Raises the first exception that is sent back instead of a reply, and `gevent.Timeout` if `n` replies don't arrive in
+    `timeout` seconds. Any replies after the first `n` go to dead letters.
+
+    """
+    if not 0 < n <= len(refs):
+        raise ValueError("cannot wait for %r replies from %d actors" % (n, len(refs)))
+    replies = []
+
+    def on_reply(result, i, reply):
+        if isinstance(reply, BaseException):
+            result.set_exception(reply)
+        else:
+            replies.append(reply)
+            if len(replies) == n:
+                result.set(replies)
+    return _scatter(refs, message, timeout, on_reply)
+
+
+def ask_quorum(refs, message, n=None, timeout=None):
+    """Sends `message` to all of `refs` and returns the reply that `n` of them agree on; by default, a majority.
+
+    Exceptions sent back count as votes that agree with nothing. Raises `NoQuorum` as soon as no reply can get `n`
+    votes anymore, and `gevent.Timeout` if there's no quorum in `timeout` seconds.
+
+    """
+    n = len(refs) // 2 + 1 if n is None else n
+    if not 0 < n <= len(refs):
+        raise ValueError("cannot wait for a quorum of %r out of %d actors" % (n, len(refs)))
+    votes, missing = [], [len(refs)]  # votes: [reply, count] pairs; replies can be unhashable
+
+    def on_reply(result, i, reply):
+        missing[0] -= 1
+        if not isinstance(reply, BaseException):
+            for vote in votes:
+                if vote[0] == reply:
+                    vote[1] += 1
+                    break
+            else:
+                vote = [reply, 1]
+                votes.append(vote)
+            if vote[1] == n:
+                result.set(reply)
+                return
+        if max([x[1] for x in votes] or [0]) + missing[0] < n:
+            result.set_exception(NoQuorum("no %d of the %d replies agree" % (n, len(refs))))
+    return _scatter(refs, message, timeout, on_reply)
+
+
+def _scatter(refs, message, timeout, on_reply):
+    """Sends `message` to each of `refs`, each with a `_Promise` of its own for the reply, and waits for the result.
+
+    All replies go to `on_reply(result, i, reply)`, where `i` is the index of the replying ref in `refs`; it's expected
+    to eventually resolve the `AsyncResult` `result`.
+
+    """
+    context = get_context()
+    node = context.node if context else refs[0].node
+    result = AsyncResult()
+
+    def deliver(i, reply):
+        if not result.ready():  # replies can still arrive before the waiting greenlet gets to close the promises
+            on_reply(result, i, reply)
+    promises = [_Promise(node, partial(deliver, i)) for i in xrange(len(refs))]
+    try:
+        for ref, promise in zip(refs, promises):
+            ref.send(message, _sender=promise.ref)
+        return result.get(timeout=timeout)
+    finally:
+        for promise in promises:
+            promise.close()
+
+
+def _resolve(result, reply):
+    (result.set_exception if isinstance(reply, BaseException) else result.set)(reply)
+
+
+class _Promise(object):
+    """Stands in for the cell of the sender of an `ask`: just a callback for the reply, with no actor or greenlet.
+
+    While open, it can be looked up like an actor, and thus replied to from other nodes as well, under a path of its own
+    that can't clash with any actor. The first regular message, or an exception, is passed to `on_reply` and closes it.
+
+    """
+    __slots__ = ('on_reply', 'uri', 'node', 'stopped', 'watchers')
+
+    _ids = count(1)
+
+    def __init__(self, node, on_reply):
+        self.on_reply = on_reply
+        self.uri = (node._uri if node else Uri.parse('')) / ('$ask%d' % next(self._ids))
+        self.node = node
+        self.stopped = False
+        self.watchers = None
+        if node:
+            node._cells[self.uri.path] = self
+
+    @property
+    def ref(self):
+        return Ref(cell=self, uri=self.uri, node=self.node)
+
+    def receive(self, message, _sender, _may_block=True):
+        if self.stopped:  # pragma: no cover
+            Events.log(DeadLetter(self.ref, message, _sender))
+        elif ('_watched', ANY) == message:
+            self.watchers = (self.watchers or []) + [message[1]]
+        elif not _is_system(message):
+            self.close()
+            self.on_reply(message)
+
+    def close(self):
+        if not self.stopped:
+            self.stopped = True
+            if self.node and self.node._cells.get(self.uri.path) is self:
+                del self.node._cells[self.uri.path]
+            for watcher in (self.watchers or []):
+                watcher << ('terminated', self.ref)
+
+    def __repr__(self):
+        return '<promise:%s>' % (self.uri.path,)
@@ -0,0 +1,140 @@
+# coding: utf-8
+from __future__ import print_function
+
+import sys
+from math import ceil
+
+from gevent.hub import get_hub
+
+
+class TimerWheel(object):
+    """Runs callbacks after a delay, for any number of pending timers at O(1) cost per timer.
+
+    Time is cut into ticks of `resolution` seconds, and each timer is put in the bucket of the tick it's due in; the
+    buckets are hashed by tick number, so that there is no fixed wheel size to wrap around and no rounds to count.
+    Scheduling and cancelling a timer are thus a dict lookup and a set operation, and each tick only touches the timers
+    that are actually due in it. A single repeating loop timer drives the wheel, and only while any timers are pending.
+
+    Timers never fire early, but may fire up to `resolution` seconds late. Callbacks run in the gevent hub, just like
+    those of `loop.timer`, so they must not block; errors raised by them are reported by the hub.
+
+    Every `Node` has a wheel of its own as `Node.timers`; `send_later` and `get(timeout=)` of actors go through it.
+
+    """
+    def __init__(self, resolution=0.01):
+        if not isinstance(resolution, (int, float)) or resolution <= 0:
+            raise TypeError("timer resolution should be a positive number of seconds, not %r" % (resolution,))
+        self.resolution = resolution
+        self._loop = get_hub().loop
+        self._epoch = self._loop.now()
+        self._tick = 0  # the last tick that has been run
+        self._buckets = {}  # tick => set of timers due in it
+        self._pending = 0
+        self._driver = None
+
+    def call_later(self, delay, fn, *args, **kwargs):
+        """Calls `fn(*args, **kwargs)` in `delay` seconds; returns a `Timer` that can be used to cancel the call."""
+        if not self._pending:
+            self._start()
+        tick = int(ceil((self._loop.now() + delay - self._epoch) / self.resolution))
+        if tick <= self._tick:
+            tick = self._tick + 1
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = set()
+        timer = Timer(self, fn, args, kwargs, bucket)
+        bucket.add(timer)
+        self._pending += 1
+        return timer
+
+    def __len__(self):
+        return self._pending
+
+    def stop(self):
+        """Drops all pending timers without calling them."""
+        for bucket in self._buckets.itervalues():
+            for timer in bucket:
+                timer._bucket = None
+        self._buckets.clear()
+        self._pending = 0
+        self._halt()
+
+    def _start(self):
+        self._tick = self._now_tick()
+        if self._driver is None:
+            self._driver = self._loop.timer(self.resolution, self.resolution)
+            self._driver.start(self._run)
+
+    def _halt(self):
+        if self._driver is not None:
+            self._driver.stop()
+            self._driver.close()
+            self._driver = None
+            self._buckets.clear()  # only buckets emptied by `Timer.cancel` can be left
+
+    def _cancelled(self):
+        self._pending -= 1
+        if not self._pending:
+            self._halt()
+
+    def _now_tick(self):
+        return int((self._loop.now() - self._epoch) / self.resolution)
+
+    def _run(self):
+        now, buckets = self._now_tick(), self._buckets
+        if now - self._tick <= len(buckets):
+            due = [buckets.pop(tick) for tick in xrange(self._tick + 1, now + 1) if tick in buckets]
+        else:  # the loop was held up for long; it's cheaper to go over the buckets than over the ticks missed
+            due = [buckets.pop(tick) for tick in sorted(tick for tick in buckets if tick <= now)]
+        self._tick = now
+        for bucket in due:
+            for timer in list(bucket):
+                if timer._bucket is None:
+                    continue  # cancelled by one of the callbacks before it
+                timer._bucket = None
+                self._pending -= 1
+                try:
+                    timer.fn(*timer.args, **timer.kwargs)
+                except:
+                    get_hub().handle_error(timer.fn, *sys.exc_info())
+        if not self._pending:
+            self._halt()
+
+    def __repr__(self):
+        return '<timer-wheel:%d pending>' % (self._pending,)
+
+
+class Timer(object):
+    """A handle to a call scheduled with `TimerWheel.call_later`."""
+    __slots__ = ('wheel', 'fn', 'args', 'kwargs', '_bucket')
+
+    def __init__(self, wheel, fn, args, kwargs, bucket):
+        self.wheel, self.fn, self.args, self.kwargs, self._bucket = wheel, fn, args, kwargs, bucket
+
+    @property
+    def pending(self):
+        """Whether the call is yet to be made."""
+        return self._bucket is not None
+
+    def cancel(self):
+        """Prevents the call from being made if it hasn't already been; returns whether it was still pending."""
+        bucket, self._bucket = self._bucket, None
+        if bucket is None:
+            return False
+        bucket.discard(self)
+        self.wheel._cancelled()
+        return True
+
+    def __repr__(self):
+        return '<timer:%r%s>' % (self.fn, '' if self.pending else ' (done)')
+
+
+_default = None
+
+
+def default_wheel():
+    """The wheel used by actors and refs that don't belong to any `Node`."""
+    global _default
+    if _default is None:
+        _default = TimerWheel()
+    return _default
@@ -1,4 +1,4 @@
-from collections import deque
+import weakref
 
 from spinoff.util.pattern_matching import Matcher
 from spinoff.actor.validate import _validate_nodeid
@@ -12,25 +12,43 @@ class Uri(object):
     are `['']`. The root `Uri` is also only `__eq__` to `''` and not `'/'`.
 
     """
-    _node = None
+    __slots__ = ('name', 'parent', 'node', 'root', 'path', '_str', '_hash', '_steps', '__weakref__')
 
-    def __init__(self, name, parent, node=None):
+    # str => Uri; makes equal `Uri`s the same object so that they can be compared by identity
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, name, parent, node=None):
         if name and node:
             raise TypeError("node specified for a non-root Uri")  # pragma: no cover
-        self.name, self.parent = name, parent
-        if node:
+        name = name or ''
+        if parent is not None:
+            path, node = parent.path + '/' + name, parent.node
+        else:
+            path = name
+        as_str = node + path if node else path
+        try:
+            return cls._interned[as_str]
+        except KeyError:
+            pass
+        if node and parent is None:
             _validate_nodeid(node)
-            self._node = node
-
-    @property
-    def root(self):
-        """Returns the topmost `Uri` this `Uri` is part of."""
-        return self.parent.root if self.parent else self
-
-    @property
-    def node(self):
-        """Returns the node ID this `Uri` points to."""
-        return self.root._node
+        self = object.__new__(cls)
+        init = super(Uri, self).__setattr__
+        init('name', name)
+        init('parent', parent)
+        init('node', node or None)  # the node ID this `Uri` points to
+        init('root', parent.root if parent is not None else self)  # the topmost `Uri` this `Uri` is part of
+        init('path', path)  # the `Uri` without the `node` part
+        init('_str', as_str)
+        init('_hash', hash(as_str))
+        init('_steps', None)
+        cls._interned[as_str] = self
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Uris are immutable")
+
+    __delattr__ = __setattr__
 
     def __div__(self, child):
         """Builds a new child `Uri` of this `Uri` with the given `name`."""
@@ -42,21 +60,15 @@ class Uri(object):
             raise TypeError("Traversing more than 1 level at a time is not supported (yet)")  # pragma: no cover
         return Uri(name=child, parent=self)
 
-    @property
-    def path(self):
-        """Returns the `Uri` without the `node` part as a `str`."""
-        return '/'.join(self.steps)
-
     @property
     def steps(self):
-        """Returns an iterable containing the steps to this `Uri` from the root `Uri`, including the root `Uri`."""
-        def _iter(uri, acc):
-            acc.appendleft(uri.name if uri.name else '')
-            return _iter(uri.parent, acc) if uri.parent else acc
-        return _iter(self, acc=deque())
+        """Returns a tuple of the steps to this `Uri` from the root `Uri`, including the root `Uri`."""
+        if self._steps is None:
+            super(Uri, self).__setattr__('_steps', self.parent.steps + (self.name,) if self.parent else (self.name,))
+        return self._steps
 
     def __str__(self):
-        return (self.node or '') + self.path
+        return self._str
 
     def __repr__(self):
         return '<@%s>' % (str(self),)
@@ -80,6 +92,10 @@ class Uri(object):
         (None, ['foo', 'bar'], 'foo/bar', 'bar')
 
         """
+        try:
+            return cls._interned[addr]
+        except KeyError:
+            pass
         if addr.endswith('/'):
             raise ValueError("Uris must not end in '/'")  # pragma: no cover
         parts = addr.split('/')
@@ -103,7 +119,7 @@ class Uri(object):
             return Uri.parse(self.path)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other):
         """Returns `True` if `other` points to the same actor.
@@ -111,9 +127,14 @@ class Uri(object):
         This method is cooperative with the `pattern_matching` module.
 
         """
-        if isinstance(other, str):
-            other = Uri.parse(other)
-        return str(self) == str(other) or isinstance(other, Matcher) and other == self
+        if other is self:
+            return True
+        elif isinstance(other, str):
+            return self._str == other
+        return isinstance(other, Matcher) and other == self
 
     def __ne__(self, other):
         return not (self == other)
+
+    def __reduce__(self):
+        return Uri.parse, (str(self),)
@@ -0,0 +1,49 @@
+"""Request/response round trips with `Ref.ask` between two local actors.
+
+    $ python -m spinoff.benchmarks.ask [NUM_ASKS]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from gevent.event import AsyncResult
+
+from spinoff.actor import Actor, Node
+
+
+class Echo(Actor):
+    def receive(self, message):
+        self.sender << message
+
+
+class Asker(Actor):
+    def __init__(self, echo, n, done):
+        self.echo, self.n, self.done = echo, n, done
+
+    def receive(self, message):
+        for i in xrange(self.n):
+            self.echo.ask(i)
+        self.done.set(None)
+
+
+def run(n):
+    node = Node()
+    try:
+        done = AsyncResult()
+        asker = node.spawn(Asker.using(node.spawn(Echo), n, done))
+        t0 = time.time()
+        asker << 'go'
+        done.get()
+        return time.time() - t0
+    finally:
+        node.stop()
+
+
+def main(n=10000):
+    print("%8d asks/s" % (n / run(n),))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
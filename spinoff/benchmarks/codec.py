@@ -0,0 +1,50 @@
+"""Encoding and decoding typical remote messages with each of the wire codecs.
+
+    $ python -m spinoff.benchmarks.codec [NUM_MESSAGES]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from spinoff.actor import Node
+from spinoff.remoting.codec import BinaryCodec, LegacyPickleCodec, PickleCodec, PathTable
+
+
+def payloads(node):
+    sender = node.lookup_str('other:1/some/sender')
+    return [
+        ('string', 'ping'),
+        ('tuple', ('job', 123, 'some-job-name', 4.5, sender)),
+        ('ref', ('subscribe', node.lookup_str('other:1/some/deep/path/to/a/subscriber'))),
+        ('nested', ('batch', tuple(('item', i, float(i)) for i in range(10)))),
+        ('dict', ('state', {'a': 1, 'b': [1, 2, 3], 'c': 'x' * 100})),
+    ], sender
+
+
+def run(n):
+    node = Node('me:1')
+    try:
+        cases, sender = payloads(node)
+        for label, message in cases:
+            for codec_label, codec, compress_paths in [('legacy', LegacyPickleCodec(), False), ('pickle', PickleCodec(), False),
+                                                       ('binary', BinaryCodec(), False), ('binary+paths', BinaryCodec(), True)]:
+                # with tables of paths, all but the first message refer to the paths by their IDs
+                paths_out, paths_in = (PathTable(), PathTable()) if compress_paths else (None, None)
+                codec.decode(node, codec.encode('/some/actor', message, sender, paths=paths_out), paths=paths_in)
+                t0 = time.time()
+                for _ in xrange(n):
+                    data = codec.encode('/some/actor', message, sender, paths=paths_out)
+                t1 = time.time()
+                for _ in xrange(n):
+                    codec.decode(node, data, paths=paths_in)
+                t2 = time.time()
+                print("%-8s %-12s %4d bytes %10d encoded/s %10d decoded/s" % (
+                    label, codec_label, len(data), n / (t1 - t0), n / (t2 - t1)))
+    finally:
+        node.stop()
+
+
+if __name__ == '__main__':
+    run(*([int(x) for x in sys.argv[1:]] or [20000]))
@@ -0,0 +1,80 @@
+"""Detection latency against false positives of telling nodes down after a fixed silence and with the phi accrual
+failure detector, on a simulated network.
+
+Each node pings every second, give or take some jitter, over a link with some latency; now and then, it stalls for a
+while (a GC pause, a load spike), after which the pings it sent in the meanwhile arrive at once. In the end, it crashes.
+A false positive is a node considered down during a stall; the detection latency is how long it takes for a node to be
+considered down after it has crashed. Nodes on a quiet LAN and on a busy WAN link are simulated separately.
+
+    $ python -m spinoff.benchmarks.failuredetector [NUM_NODES [HOURS]]
+
+"""
+from __future__ import print_function
+
+import random
+import sys
+
+from spinoff.remoting.failuredetector import PhiAccrualFailureDetector
+
+
+INTERVAL = 1.0
+# jitter (as a fraction of the interval), mean latency, probability of a stall per ping, mean duration of a stall
+PROFILES = [('LAN', 0.05, 0.001, 0.0005, 1.0),
+            ('WAN', 0.5, 0.05, 0.005, 1.5)]
+
+
+def arrivals(duration, jitter, latency, stall_probability, mean_stall):
+    t, stalled_until = 0.0, 0.0
+    while t < duration:
+        t += INTERVAL * random.uniform(1.0 - jitter, 1.0 + jitter)
+        if random.random() < stall_probability:
+            stalled_until = t + random.expovariate(1.0 / mean_stall)
+        yield max(t, stalled_until) + random.expovariate(1.0 / latency)
+
+
+def simulate(make_detector, num_nodes, duration, profile):
+    false_positives, latencies = 0, []
+    for i in xrange(num_nodes):
+        detector, last = make_detector(), None
+        for t in arrivals(duration, *profile):
+            if last is not None and t > detector.time_of_failure(i):
+                false_positives += 1
+            detector.heartbeat(i, t)
+            last = t
+        latencies.append(detector.time_of_failure(i) - last)
+    return false_positives, latencies
+
+
+class FixedSilence(object):
+    """Considers a node down after a fixed silence, like `HubLogic` without a failure detector."""
+    def __init__(self, max_silence):
+        self.max_silence, self.last = max_silence, {}
+
+    def heartbeat(self, nid, t):
+        self.last[nid] = t
+
+    def time_of_failure(self, nid):
+        return self.last[nid] + self.max_silence
+
+
+def main(num_nodes=200, hours=1):
+    random.seed(0)
+    duration = hours * 3600.0
+    for label, make_detector in [
+        ('fixed 3s', lambda: FixedSilence(3.0)),
+        ('fixed 5s', lambda: FixedSilence(5.0)),
+        ('phi 3', lambda: PhiAccrualFailureDetector(3.0, INTERVAL, INTERVAL / 10.0)),
+        ('phi 8', lambda: PhiAccrualFailureDetector(8.0, INTERVAL, INTERVAL / 10.0)),
+        ('phi 12', lambda: PhiAccrualFailureDetector(12.0, INTERVAL, INTERVAL / 10.0)),
+        ('phi 8, pause 2s', lambda: PhiAccrualFailureDetector(8.0, INTERVAL, INTERVAL / 10.0, acceptable_pause=2.0)),
+        ('phi 8, pause 5s', lambda: PhiAccrualFailureDetector(8.0, INTERVAL, INTERVAL / 10.0, acceptable_pause=5.0)),
+    ]:
+        for profile_label, profile in [(x[0], x[1:]) for x in PROFILES]:
+            false_positives, latencies = simulate(make_detector, num_nodes, duration, profile)
+            print("%-16s %s %8.2f false positives/node/hour %6.2fs mean detection latency (%.2fs at most)" % (
+                label, profile_label, false_positives / float(num_nodes * hours),
+                sum(latencies) / len(latencies), max(latencies)))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,55 @@
+"""Heartbeating thousands of nodes with `HubLogic`, on a simulated network in which each node answers every ping.
+
+Compares heartbeats every `heartbeat_interval` with heartbeats that happen whenever the next node is due, with jitter.
+
+    $ python -m spinoff.benchmarks.heartbeat [NUM_NODES ...]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from spinoff.remoting.hublogic import HubLogic, Ping, NextBeat, NodeDown, IN, flatten
+
+
+LATENCY = 0.001
+DURATION = 60.0  # simulated seconds
+
+
+def run(n, jitter):
+    logic = HubLogic('me:1', heartbeat_interval=1.0, heartbeat_max_silence=3.0, heartbeat_jitter=jitter)
+    nids = ['node%d:1' % i for i in xrange(n)]
+    versions = dict.fromkeys(nids, 0)
+    t = 0.0
+    for nid in nids:
+        for _ in flatten(logic.ping_received(IN, nid, 0, t)):
+            pass
+    beats, max_pings, elapsed = 0, 0, 0.0
+    while t < DURATION:
+        t0 = time.time()
+        actions = list(flatten(logic.heartbeat(t)))
+        elapsed += time.time() - t0
+        beats += 1
+        pinged = [x[2] for x in actions if x[0] is Ping]
+        assert not any(x[0] is NodeDown for x in actions)
+        max_pings = max(max_pings, len(pinged))
+        for nid in pinged:
+            versions[nid] += 1
+            for _ in flatten(logic.ping_received(IN, nid, versions[nid], t + LATENCY)):
+                pass
+        (_, time_to_next), = [x for x in actions if x[0] is NextBeat]
+        t += time_to_next
+    return beats, max_pings, elapsed
+
+
+def main(counts=(1000, 10000)):
+    for n in counts:
+        for label, jitter in [('fixed beat', 0.0), ('jittered', 0.2)]:
+            beats, max_pings, elapsed = run(n, jitter)
+            print("%6d nodes, %-10s %5d beats %6d pings/beat at most %8.1f us/node/s" % (
+                n, label, beats, max_pings, elapsed / DURATION / n * 1e6))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or (1000, 10000))
@@ -0,0 +1,66 @@
+"""Memory taken by idle actors; compares a greenlet per actor with actors run by a pooled `Dispatcher`.
+
+    $ python -m spinoff.benchmarks.memory [--max-bytes=BYTES] [NUM_ACTORS ...]
+
+By default, 100k and 1M actors are spawned. Each configuration is measured in a fresh interpreter so that memory freed
+by one doesn't skew the other. With `--max-bytes`, the exit status is non-zero if any configuration takes more than
+`BYTES` per actor, so that regressions in the per-actor footprint can be caught.
+
+"""
+from __future__ import print_function
+
+import gc
+import os
+import resource
+import subprocess
+import sys
+
+from gevent import idle
+
+from spinoff.actor import Actor, Node
+from spinoff.actor.dispatcher import Dispatcher
+
+
+class Idle(Actor):
+    def receive(self, message):
+        pass
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def measure(pooled, n):
+    """Returns the number of bytes per actor taken by `n` started, idle actors."""
+    node = Node(dispatcher=Dispatcher() if pooled else None)
+    gc.collect()
+    before = rss()
+    for _ in xrange(n):
+        node.spawn(Idle)
+    idle()  # let all of them start
+    gc.collect()
+    return (rss() - before) / n
+
+
+def main(counts=(100000, 1000000), max_bytes=None):
+    ok = True
+    for n in counts:
+        for label, pooled in [('greenlet per actor', False), ('pooled dispatcher', True)]:
+            out = subprocess.check_output([sys.executable, '-m', 'spinoff.benchmarks.memory', '--measure', str(int(pooled)), str(n)])
+            per_actor = int(out)
+            ok = ok and (max_bytes is None or per_actor <= max_bytes)
+            print("%8d x %-20s %8d bytes/actor" % (n, label, per_actor))
+    return ok
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--measure']:
+        print(measure(bool(int(args[1])), int(args[2])))
+        sys.stdout.flush()
+        os._exit(0)  # stopping all of the actors would just take time
+    max_bytes = None
+    if args and args[0].startswith('--max-bytes='):
+        max_bytes = int(args.pop(0).split('=', 1)[1])
+    sys.exit(0 if main([int(x) for x in args] or (100000, 1000000), max_bytes) else 1)
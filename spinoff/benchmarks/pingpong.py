@@ -0,0 +1,65 @@
+"""Ping-pong between two local actors; compares inline `receive` dispatch with a greenlet per message.
+
+    $ python -m spinoff.benchmarks.pingpong [NUM_ROUNDTRIPS]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from gevent.event import AsyncResult
+
+from spinoff.actor import Actor, Node
+
+
+class Ponger(Actor):
+    def receive(self, message):
+        self.sender << message
+
+
+class Pinger(Actor):
+    def __init__(self, ponger, n, done):
+        self.ponger, self.n, self.done = ponger, n, done
+
+    def pre_start(self):
+        self.ponger << self.n
+
+    def receive(self, n):
+        if n:
+            self.ponger << n - 1
+        else:
+            self.done.set(None)
+
+
+class BlockingPonger(Ponger):
+    blocking = True
+
+
+class BlockingPinger(Pinger):
+    blocking = True
+
+
+def run(pinger_cls, ponger_cls, n):
+    node = Node()
+    try:
+        done = AsyncResult()
+        ponger = node.spawn(ponger_cls)
+        t0 = time.time()
+        node.spawn(pinger_cls.using(ponger, n, done))
+        done.get()
+        return time.time() - t0
+    finally:
+        node.stop()
+
+
+def main(n=20000):
+    # each roundtrip is 2 messages
+    for label, pinger_cls, ponger_cls in [('greenlet per message', BlockingPinger, BlockingPonger),
+                                          ('inline', Pinger, Ponger)]:
+        elapsed = run(pinger_cls, ponger_cls, n)
+        print("%-22s %8d msg/s" % (label, 2 * n / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,63 @@
+"""Streams of messages from an actor on one node to an actor on another.
+
+For small messages, sending each message in a frame of its own is compared with batching; for large binary payloads,
+embedding them in the message is compared with sending them out of band.
+
+    $ python -m spinoff.benchmarks.remote [NUM_MESSAGES [NUM_BLOBS [BLOB_SIZE]]]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from gevent import sleep
+from gevent.event import AsyncResult
+
+from spinoff.actor import Actor, Node
+from spinoff.remoting.codec import BinaryCodec
+
+
+class Counter(Actor):
+    def __init__(self, n, done):
+        self.n, self.done = n, done
+
+    def receive(self, message):
+        self.n -= 1
+        if not self.n:
+            self.done.set(None)
+
+
+def run(n, hub_kwargs={}, codec=None, payload=None, chunk=1000):
+    sender = Node('localhost:20901', enable_remoting=True, hub_kwargs=hub_kwargs, codec=codec)
+    receiver = Node('localhost:20902', enable_remoting=True, hub_kwargs=hub_kwargs, codec=codec)
+    try:
+        done, warmed_up = AsyncResult(), AsyncResult()
+        receiver.spawn(Counter.using(1, warmed_up), name='warmup')
+        receiver.spawn(Counter.using(n, done), name='counter')
+        sender.lookup_str('localhost:20902/warmup') << 'hello'  # let the nodes connect first
+        warmed_up.get()
+        counter = sender.lookup_str('localhost:20902/counter')
+        t0 = time.time()
+        for i in xrange(n):
+            counter << ('msg', i, payload)
+            if not i % chunk:
+                sleep(0)
+        done.get()
+        return time.time() - t0
+    finally:
+        sender.stop()
+        receiver.stop()
+
+
+def main(n=100000, num_blobs=200, blob_size=4 * 1024 * 1024):
+    for label, hub_kwargs in [('frame per message', {}), ('batching', {'batching': True})]:
+        print("%-18s %8d msg/s" % (label, n / run(n, hub_kwargs=hub_kwargs)))
+    blob = bytearray(blob_size)
+    for label, codec in [('inline blobs', BinaryCodec(oob_threshold=None)), ('out-of-band blobs', BinaryCodec())]:
+        elapsed = run(num_blobs, codec=codec, payload=blob, chunk=1)
+        print("%-18s %8d MB/s" % (label, num_blobs * blob_size / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
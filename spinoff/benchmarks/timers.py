@@ -0,0 +1,81 @@
+"""Scheduling, cancelling and firing many pending timers; compares `TimerWheel` with a `gevent.spawn_later` per timer.
+
+    $ python -m spinoff.benchmarks.timers [NUM_TIMERS ...]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from gevent import spawn_later, sleep
+from gevent.event import Event
+
+from spinoff.actor.timers import TimerWheel
+
+
+def _noop():
+    pass
+
+
+def wheel_schedule_cancel(n):
+    wheel = TimerWheel()
+    t0 = time.time()
+    timers = [wheel.call_later(60.0, _noop) for _ in xrange(n)]
+    t1 = time.time()
+    for timer in timers:
+        timer.cancel()
+    return t1 - t0, time.time() - t1
+
+
+def greenlets_schedule_cancel(n):
+    t0 = time.time()
+    timers = [spawn_later(60.0, _noop) for _ in xrange(n)]
+    t1 = time.time()
+    for timer in timers:
+        timer.kill(block=False)
+    ret = t1 - t0, time.time() - t1
+    sleep(0)  # let the killed greenlets go
+    return ret
+
+
+def wheel_fire(n):
+    wheel, done, left = TimerWheel(), Event(), [n]
+
+    def fire():
+        left[0] -= 1
+        if not left[0]:
+            done.set()
+    t0 = time.time()
+    for i in xrange(n):
+        wheel.call_later(.001 * (i % 100), fire)
+    done.wait()
+    return time.time() - t0
+
+
+def greenlets_fire(n):
+    done, left = Event(), [n]
+
+    def fire():
+        left[0] -= 1
+        if not left[0]:
+            done.set()
+    t0 = time.time()
+    for i in xrange(n):
+        spawn_later(.001 * (i % 100), fire)
+    done.wait()
+    return time.time() - t0
+
+
+def main(counts=(100000, 1000000)):
+    for n in counts:
+        for label, schedule_cancel, fire in [('timer wheel', wheel_schedule_cancel, wheel_fire),
+                                             ('spawn_later', greenlets_schedule_cancel, greenlets_fire)]:
+            scheduled, cancelled = schedule_cancel(n)
+            fired = fire(n)
+            print("%8d x %-12s %10d scheduled/s %10d cancelled/s %10d fired/s" % (
+                n, label, n / scheduled, n / cancelled, n / fired))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or (100000, 1000000))
@@ -0,0 +1,89 @@
+"""Latency and throughput between two nodes on the same host, over TCP and over Unix domain sockets.
+
+Latency is measured with round trips of one message at a time, throughput with a stream of small messages.
+
+    $ python -m spinoff.benchmarks.transport [NUM_ROUND_TRIPS [NUM_MESSAGES]]
+
+"""
+from __future__ import print_function
+
+import shutil
+import sys
+import tempfile
+import time
+
+from gevent import sleep
+from gevent.event import AsyncResult
+
+from spinoff.actor import Actor, Node
+
+
+class Echo(Actor):
+    def receive(self, message):
+        self.sender << message
+
+
+class Pinger(Actor):
+    def __init__(self, echo, n, done):
+        self.echo, self.n, self.done = echo, n, done
+
+    def receive(self, message):
+        if message == 'start':
+            self.t0 = time.time()
+        else:
+            self.n -= 1
+            if not self.n:
+                self.done.set(time.time() - self.t0)
+                return
+        self.echo << 'ping'
+
+
+class Counter(Actor):
+    def __init__(self, n, done):
+        self.n, self.done = n, done
+
+    def receive(self, message):
+        self.n -= 1
+        if not self.n:
+            self.done.set(None)
+
+
+def run(num_round_trips, num_messages, ipc_dir, chunk=1000):
+    hub_kwargs = {'ipc_dir': ipc_dir}
+    sender = Node('localhost:20901', enable_remoting=True, hub_kwargs=hub_kwargs)
+    receiver = Node('localhost:20902', enable_remoting=True, hub_kwargs=hub_kwargs)
+    try:
+        receiver.spawn(Echo, name='echo')
+        warmed_up, round_trips, streamed = AsyncResult(), AsyncResult(), AsyncResult()
+        sender.spawn(Pinger.using(sender.lookup_str('localhost:20902/echo'), 1, warmed_up)) << 'start'
+        warmed_up.get()  # let the nodes connect first
+        sender.spawn(Pinger.using(sender.lookup_str('localhost:20902/echo'), num_round_trips, round_trips)) << 'start'
+        latency = round_trips.get() / num_round_trips
+
+        receiver.spawn(Counter.using(num_messages, streamed), name='counter')
+        counter = sender.lookup_str('localhost:20902/counter')
+        t0 = time.time()
+        for i in xrange(num_messages):
+            counter << ('msg', i)
+            if not i % chunk:
+                sleep(0)
+        streamed.get()
+        return latency, num_messages / (time.time() - t0), sender._hub._endpoints['localhost:20902']
+    finally:
+        sender.stop()
+        receiver.stop()
+
+
+def main(num_round_trips=10000, num_messages=100000):
+    ipc_dir = tempfile.mkdtemp()
+    try:
+        for label, dir in [('tcp', None), ('ipc', ipc_dir)]:
+            latency, throughput, endpoint = run(num_round_trips, num_messages, dir)
+            assert endpoint.startswith(label + '://'), endpoint
+            print("%-4s %8.1f us/round trip %8d msg/s" % (label, latency * 1e6, throughput))
+    finally:
+        shutil.rmtree(ipc_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -3,6 +3,7 @@ from __future__ import print_function, absolute_import
 
 from .hub import Hub
 from .noremoting import HubWithNoRemoting
+from .loopback import LoopbackHub
 
 
-__all__ = [Hub, HubWithNoRemoting]
+__all__ = [Hub, HubWithNoRemoting, LoopbackHub]
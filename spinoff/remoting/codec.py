@@ -0,0 +1,188 @@
+# coding: utf8
+from __future__ import print_function, absolute_import
+
+import struct
+
+from spinoff.actor.ref import Ref
+from spinoff.remoting.exceptions import UnknownPath
+from spinoff.remoting.pathtable import PathTable, NO_PATHS
+from spinoff.remoting.pickler import OutOfBand, dumps, loads, load_ref, legacy_dumps_envelope
+
+
+__all__ = ['Codec', 'BinaryCodec', 'PickleCodec', 'LegacyPickleCodec', 'PathTable', 'UnknownPath']
+
+
+BINARY_MAGIC = '\x01'  # pickles (protocol 2) start with '\x80' instead
+
+# magic, and the epoch of the table of paths the message uses (see `PathTable`); followed by the path and the URI of the
+# sender, in the format of `_dump_path`, and the pickled message
+_HEADER = struct.Struct('!cB')
+
+_U16 = struct.Struct('!H')
+_U16_U16 = struct.Struct('!HH')
+PATH_REF, PATH_DEF = 0x8000, 0x4000  # flags in the first 16 bits of a path
+MAX_PATH_LEN = PATH_DEF - 1
+MAX_PATH_IDS = PATH_DEF  # per peer
+
+
+class Codec(object):
+    """Turns the `(path, message, sender)` envelopes of remote messages into bytes and back.
+
+    Subclasses only need to implement `encode`: all codecs decode every wire format, which is recognised by its first
+    byte, so that nodes using different codecs can still talk to each other.
+
+    """
+    def encode(self, path, message, sender, buffers=None, paths=None):  # pragma: no cover
+        """Returns the bytes of the envelope.
+
+        If `buffers` is a list, the codec can choose to append large binary payloads in the message to it instead of
+        embedding them in the bytes; the caller then has to pass them to `decode` along with the bytes.
+
+        If `paths` is a `PathTable`, it's the table of paths already sent to the receiving node, by their numeric IDs,
+        which the codec can refer to, and add to, instead of sending the same paths over and over again. It's up to the
+        caller to have the table start over whenever the receiving node might have lost its own table; see `decode`.
+
+        """
+        raise NotImplementedError
+
+    def decode(self, node, data, buffers=(), paths=None):
+        """Returns the `(path, message, sender)` encoded in `data`, with all `Ref`s in it attached to `node`.
+
+        `data` can also be a `buffer`, in which case the message is decoded right out of it without copying it first.
+
+        `paths` is the `PathTable` of the paths sent by the sending node so far, by their numeric IDs; it gets updated
+        with the paths being sent for the first time, or starts over if the message is of another epoch. Raises
+        `UnknownPath` if the message refers to a path that's not in it.
+
+        """
+        if data[:1] != BINARY_MAGIC:
+            return loads(node, data, buffers)
+        _, epoch = _HEADER.unpack_from(data)
+        if epoch != NO_PATHS and paths is not None and paths.epoch != epoch:
+            paths.start_over(epoch)  # whatever it has is from an earlier epoch
+        path, pos = _load_path(data, _HEADER.size, paths)
+        sender, pos = _load_path(data, pos, paths)
+        sender = load_ref(node, sender) if sender else None
+        return path, loads(node, buffer(data, pos), buffers), sender
+
+
+class LegacyPickleCodec(Codec):
+    """Pickles everything in the format of the nodes from before there were codecs, which is all they can decode.
+
+    This is the default of `Node`, as long as there might be such nodes around; once all nodes can decode what the other
+    codecs encode, switch to `BinaryCodec`.
+
+    """
+    def encode(self, path, message, sender, buffers=None, paths=None):
+        return legacy_dumps_envelope(path, message, sender)
+
+
+class PickleCodec(Codec):
+    """Pickles everything, with `Ref`s as persistent IDs so that the C unpickler can attach them to the receiving node.
+
+    Nodes from before there were codecs can't decode this; see `LegacyPickleCodec`.
+
+    """
+
+    def encode(self, path, message, sender, buffers=None, paths=None):
+        return dumps((path, message, sender))
+
+
+class BinaryCodec(Codec):
+    """A binary envelope around messages pickled the way `PickleCodec` does, for sending large binary payloads out of
+    band, and paths by ID. Nodes from before there were codecs can't decode it, so it has to be opted into; see
+    `LegacyPickleCodec`.
+
+    The path and the URI of the sender follow a two-byte header, and the pickled message follows them.
+
+    `bytearray`s of at least `oob_threshold` bytes, and all `buffer`s and `memoryview`s, anywhere in a message, as well
+    as `str`s of at least `oob_threshold` bytes anywhere in a (nested) tuple, are sent out of band, as separate frames,
+    instead of being copied into the envelope. On the receiving node, `buffer`s and `memoryview`s are handed to the
+    actor as views of the received frame, without any copying; `str`s and `bytearray`s are copied once, into a new
+    object of their own type. On the sending node, the `Hub` sends large payloads right out of the objects in the
+    message, so a `bytearray` (or anything a `buffer` or `memoryview` refers to) must not be changed after it has been
+    sent, for as long as it might not have gone out yet.
+
+    With `compress_paths`, paths and sender URIs are sent only once per receiving node, and referred to by a 16 bit ID
+    afterwards, which makes for smaller envelopes than those of `PickleCodec`.
+
+    """
+    def __init__(self, oob_threshold=64 * 1024, compress_paths=True):
+        self.oob_threshold = oob_threshold
+        self.compress_paths = compress_paths
+
+    def encode(self, path, message, sender, buffers=None, paths=None):
+        if sender is None:
+            sender = ''
+        elif type(sender) is Ref:
+            sender = str(sender.uri)
+        else:  # pragma: no cover
+            return dumps((path, message, sender))
+        threshold = self.oob_threshold
+        if threshold is None:
+            buffers = None
+        num_buffers = len(buffers) if buffers is not None else 0
+        data = dumps(message, buffers, threshold)
+        if buffers is not None and len(data) >= threshold:
+            # there might be large `str`s in it, which the pickler doesn't let us take out of it as it goes
+            del buffers[num_buffers:]
+            data = dumps(_scan(message, buffers, threshold), buffers, threshold)
+        if not self.compress_paths:
+            paths = None
+        elif paths is not None and len(paths) > MAX_PATH_IDS - 2:
+            paths.start_over()  # there might not be enough IDs left for this message
+        epoch = NO_PATHS if paths is None else paths.epoch
+        return _HEADER.pack(BINARY_MAGIC, epoch) + _dump_path(path, paths) + _dump_path(sender, paths) + data
+
+
+def _dump_path(path, paths):
+    """A path is either just its 16 bit length and the path, or that with `PATH_DEF` set, the ID it's given from now on
+    and the path, or an ID of a path sent before, with `PATH_REF` set.
+
+    """
+    if paths is not None:
+        path_id = paths.get(path)
+        if path_id is not None:
+            return _U16.pack(PATH_REF | path_id)
+        elif path and len(path) <= MAX_PATH_LEN:
+            path_id = paths[path] = len(paths)
+            return _U16_U16.pack(PATH_DEF | len(path), path_id) + path
+    if len(path) > MAX_PATH_LEN:
+        raise ValueError("path too long to send: %r" % (path,))
+    return _U16.pack(len(path)) + path
+
+
+def _load_path(data, pos, paths):
+    n, = _U16.unpack_from(data, pos)
+    pos += 2
+    if n & PATH_REF:
+        try:
+            return paths[n & ~PATH_REF], pos
+        except (KeyError, TypeError):
+            raise UnknownPath(n & ~PATH_REF)
+    path_id = None
+    if n & PATH_DEF:
+        n &= ~PATH_DEF
+        path_id, = _U16.unpack_from(data, pos)
+        pos += 2
+    path = data[pos:pos + n]
+    if len(path) != n:
+        raise ValueError("truncated message")
+    if path_id is not None and paths is not None:
+        paths[path_id] = path
+    return path, pos + n
+
+
+def _scan(x, buffers, threshold):
+    """Returns `x` with the `str`s of at least `threshold` bytes in it, if it's a (nested) tuple, moved to `buffers`;
+    `dumps` takes care of the other binary types, wherever they are.
+
+    """
+    t = type(x)
+    if t is str:
+        if len(x) >= threshold:
+            buffers.append(x)
+            return OutOfBand(len(buffers) - 1, str)
+    elif t is tuple:
+        return tuple([_scan(item, buffers, threshold) for item in x])
+    return x
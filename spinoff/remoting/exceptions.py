@@ -0,0 +1,2 @@
+class UnknownPath(KeyError):
+    """Raised by `Codec.decode` when the message refers to a path by an ID that's not in the table of the sender."""
@@ -0,0 +1,118 @@
+import math
+from collections import deque
+
+
+__all__ = ['PhiAccrualFailureDetector']
+
+
+class PhiAccrualFailureDetector(object):
+    """Tells how likely it is that a node is down from how long it's been since it was last heard from, compared to
+    the distribution of the intervals between the heartbeats received from it so far.
+
+    The suspicion level phi is the negated base 10 logarithm of the probability that a heartbeat comes even later than
+    now; a node is considered down once phi reaches `threshold`: e.g. with a threshold of 8, the likelihood of it being
+    wrong about that is about 10^-8, as far as the distribution is normal.
+
+    The intervals are approximated by a normal distribution of at least `min_std_deviation`, over the last `max_samples`
+    intervals, to which `acceptable_pause` is added; until there are any, by `first_interval` give or take a quarter.
+
+    See Hayashibara et al.: "The phi accrual failure detector" (2004).
+
+    """
+    def __init__(self, threshold=8.0, first_interval=1.0, min_std_deviation=0.1, acceptable_pause=0.0, max_samples=200):
+        self.threshold = threshold
+        self.first_interval = first_interval
+        self.min_std_deviation = min_std_deviation
+        self.acceptable_pause = acceptable_pause
+        self.max_samples = max_samples
+        self._y = _y_at(threshold)
+        self._histories = {}
+
+    def __contains__(self, nid):
+        return nid in self._histories
+
+    def heartbeat(self, nid, t):
+        history = self._histories.get(nid)
+        if history is None:
+            history = self._histories[nid] = _History(self.max_samples)
+            std = self.first_interval / 4.0
+            history.add(self.first_interval - std)
+            history.add(self.first_interval + std)
+        else:
+            history.add(t - history.last)
+        history.last = t
+
+    def phi(self, nid, t):
+        history = self._histories[nid]
+        return _phi(t - history.last, history.mean + self.acceptable_pause, self._std_deviation(history))
+
+    def is_available(self, nid, t):
+        return self.phi(nid, t) < self.threshold
+
+    def time_of_failure(self, nid):
+        """Returns when phi will reach the threshold unless a heartbeat arrives before that."""
+        history = self._histories[nid]
+        return history.last + history.mean + self.acceptable_pause + self._y * self._std_deviation(history)
+
+    def remove(self, nid):
+        self._histories.pop(nid, None)
+
+    def _std_deviation(self, history):
+        return max(history.std_deviation, self.min_std_deviation)
+
+    def __repr__(self):
+        return "PhiAccrualFailureDetector(threshold=%r)" % (self.threshold,)
+
+
+class _History(object):
+    __slots__ = ('last', 'intervals', 'sum', 'sum_of_squares')
+
+    def __init__(self, max_samples):
+        self.last = None
+        self.intervals = deque(maxlen=max_samples)
+        self.sum = self.sum_of_squares = 0.0
+
+    def add(self, interval):
+        intervals = self.intervals
+        if len(intervals) == intervals.maxlen:
+            oldest = intervals[0]
+            self.sum -= oldest
+            self.sum_of_squares -= oldest * oldest
+        intervals.append(interval)
+        self.sum += interval
+        self.sum_of_squares += interval * interval
+
+    @property
+    def mean(self):
+        return self.sum / len(self.intervals)
+
+    @property
+    def std_deviation(self):
+        mean = self.mean
+        return math.sqrt(max(self.sum_of_squares / len(self.intervals) - mean * mean, 0.0))
+
+
+# beyond this many standard deviations, phi is just capped (at about 37.6), and so is any threshold
+_MAX_Y = 10.0
+
+
+def _phi(time_diff, mean, std_deviation):
+    # the logistic approximation of the cumulative normal distribution, as used by Akka
+    y = max(min((time_diff - mean) / std_deviation, _MAX_Y), -_MAX_Y)
+    e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+    if time_diff > mean:
+        return -math.log10(e / (1.0 + e))
+    else:
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
+
+
+def _y_at(threshold):
+    """Returns how many standard deviations after the mean phi reaches `threshold`."""
+    lo, hi = 0.0, _MAX_Y
+    for _ in range(100):
+        mid = (lo + hi) / 2.0
+        if _phi(mid, 0.0, 1.0) < threshold:
+            lo = mid
+        else:
+            hi = mid
+    return hi
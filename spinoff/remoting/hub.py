@@ -1,22 +1,31 @@
 from __future__ import print_function
 
 import errno
+import os
 import time
 import socket
 import struct
 import traceback
+import zlib
+from collections import deque
+from contextlib import contextmanager
 
 import zmq.green as zmq
 from zope.interface import Interface, implements
 from zope.interface.verify import verifyClass
 from gevent import sleep, spawn, spawn_later
-from gevent.socket import gethostbyname
-from gevent.lock import RLock
+from gevent.event import Event
+from gevent.pool import Group
+from gevent.socket import gethostbyname, gethostbyname_ex, socket as gsocket
 
 from spinoff.remoting.hublogic import (
     HubLogic, Connect, Disconnect, SigDisconnect, Send, Ping,
     RelaySigNew, RelayConnect, RelaySigConnected, RelaySend, RelayForward, RelaySigNodeDown, RelayNvm,
-    Receive, SendFailed, NodeDown, NextBeat, Bind, IN, OUT, flatten)
+    Receive, SendFailed, NodeDown, NextBeat, Bind, SigResetPaths, IN, OUT, DEAD_LETTER, flatten, nid2addr)
+from spinoff.remoting.exceptions import UnknownPath
+from spinoff.remoting.failuredetector import PhiAccrualFailureDetector
+from spinoff.remoting.pathtable import PathTable
+from spinoff.remoting.resolver import Resolver
 from spinoff.util.logging import err
 
 
@@ -28,6 +37,21 @@ _signals = [struct.pack(MSG_HEADER_FORMAT, x) for x in range(9)]
 SIG_DISCONNECT, SIG_NEW_RELAY, SIG_RELAY_CONNECT, SIG_RELAY_CONNECTED, SIG_RELAY_SEND, SIG_RELAY_FORWARDED, SIG_RELAY_NODEDOWN, SIG_RELAY_NVM, SIG_VERIFY_IDENTITY = _signals
 MIN_VERSION_VALUE = len(_signals)
 MIN_VERSION_BITS = struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE)
+# a frame made up of several length-prefixed frames to the same node; taken from the top of the version range
+SIG_BATCH = struct.pack(MSG_HEADER_FORMAT, 2 ** 32 - 1)
+BATCH_ENTRY_FORMAT = '!I'
+# asks the receiver to forget the paths it has sent so far, and send them in full again; see `HubLogic.path_unknown`
+SIG_RESET_PATHS = struct.pack(MSG_HEADER_FORMAT, 2 ** 32 - 2)
+# a message whose body is zlib-compressed, followed by its version header; taken from the top of the version range, as
+# flagging it within the header itself would make messages of high enough versions look compressed
+SIG_COMPRESSED = struct.pack(MSG_HEADER_FORMAT, 2 ** 32 - 3)
+# pings carry the capabilities of the sending node after this marker, which no codec starts its output with; older nodes
+# take such a ping for a malformed message, and drop the body
+CAPABILITIES_MARKER = '\0'
+CAP_ZLIB = 0x01
+# the high-water mark of the pipes to and from nodes connected to over Unix domain sockets, beyond which ROUTER sockets
+# silently drop messages; the kernel buffers far less for them than over loopback TCP, which the default of 1000 relies on
+IPC_HWM = 100000
 
 
 class IHub(Interface):
@@ -50,6 +74,30 @@ class IHub(Interface):
 _DELETED = object()
 
 
+class HubStats(object):
+    """Counters of what a `Hub` has done so far, for monitoring."""
+    __slots__ = ('messages_compressed', 'bytes_before_compression', 'bytes_after_compression', 'compression_time',
+                 'messages_decompressed', 'decompression_time')
+
+    def __init__(self):
+        self.messages_compressed = self.messages_decompressed = 0
+        self.bytes_before_compression = self.bytes_after_compression = 0
+        self.compression_time = self.decompression_time = 0.0  # in seconds of CPU time
+
+    @property
+    def compression_ratio(self):
+        """How many times smaller the compressed messages have got, on the whole."""
+        return float(self.bytes_before_compression) / self.bytes_after_compression if self.bytes_after_compression else 1.0
+
+    def as_dict(self):
+        ret = dict((name, getattr(self, name)) for name in self.__slots__)
+        ret['compression_ratio'] = self.compression_ratio
+        return ret
+
+    def __repr__(self):
+        return "HubStats(%s)" % (", ".join("%s=%r" % x for x in sorted(self.as_dict().items())),)
+
+
 class Hub(object):
     """Handles traffic between actors on different nodes.
 
@@ -61,16 +109,59 @@ class Hub(object):
     FAKE_INACCESSIBLE_NADDRS = set()
 
     def __init__(self, nid, is_relay=False, on_node_down=lambda ref, nid: ref << ('_node_down', nid),
-                 on_receive=lambda sender_nid, msg_h: print("deliver", msg_h, "from", sender_nid),
-                 heartbeat_interval=1.0, heartbeat_max_silence=3.0):
+                 on_receive=lambda sender_nid, msg_h, buffers=(), paths=None: print("deliver", msg_h, "from", sender_nid),
+                 heartbeat_interval=1.0, heartbeat_max_silence=3.0, heartbeat_jitter=0.2,
+                 phi_threshold=None, phi_acceptable_pause=0.0,
+                 batching=False, max_batch_bytes=64 * 1024, max_batch_size=256,
+                 compression_threshold=None, compression_level=6,
+                 max_queue_size=10000, max_queue_bytes=None, queue_overflow=DEAD_LETTER,
+                 dns_ttl=60.0, dns_negative_ttl=5.0, ipc_dir=None):
         self.nid = nid
+        self.stats = HubStats()
+        # with batching, the messages sent to a node during one iteration of the event loop go out as a single frame of
+        # at most `max_batch_bytes` bytes and `max_batch_size` messages; only enable it once all nodes support batches
+        self._batches = {} if batching else None  # (sock, nid) => [frame, ...]
+        self._batch_bytes = {}  # (sock, nid) => total size of the frames in the batch
+        self.max_batch_bytes, self.max_batch_size = max_batch_bytes, max_batch_size
+        # the paths sent to and received from each node, for the codec to refer to by ID, separately over each of the
+        # sockets, as there's no telling in which order messages over different connections arrive; see `PathTable`
+        self._paths_out, self._paths_in = {}, {}  # (sock, nid) => PathTable
+        # message bodies of at least `compression_threshold` bytes are compressed, but only when sent to nodes that have
+        # told us in their pings that they can decompress them, so that older nodes keep getting what they understand
+        self.compression_threshold, self.compression_level = compression_threshold, compression_level
+        self._capabilities = CAPABILITIES_MARKER + chr(CAP_ZLIB)  # sent along with each ping
+        self._zlib_peers = set()
         self.is_relay = is_relay
         self._on_node_down = on_node_down
         self._on_receive = on_receive
-        self._lock = RLock()
+        # everything the hub does is queued up as `(fn, args)` for the writer greenlet to `_execute` one after another, so
+        # that no greenlet ever waits for another one to finish, only for the writer to get around to its work
+        self._queue = deque()
+        self._wakeup = Event()
+        # the nodes being connected to: naddr => [(frames, copy) to send to it once connected]; see `_connect`
+        self._connecting = {}
+        self._connectors = Group()
+        self._endpoints = {}  # naddr => the ZeroMQ endpoint it's been connected to
+        self._resolver = Resolver(ttl=dns_ttl, negative_ttl=dns_negative_ttl)  # see `naddr_to_zmq_endpoint`
+        # with an `ipc_dir`, the hub also listens on a Unix domain socket in it, and connects to the nodes on the same host
+        # that do the same over theirs instead of over TCP; all of them need to use the same directory
+        self.ipc_dir = ipc_dir
+        self._ipc_path = None
+        self._local_ips = set()  # the addresses of this host, for telling which nodes are on it
+        # with a `phi_threshold`, nodes that have pinged us are considered down once the phi accrual failure detector says
+        # so, instead of after `heartbeat_max_silence`; see `PhiAccrualFailureDetector`
+        failure_detector = None if phi_threshold is None else PhiAccrualFailureDetector(
+            phi_threshold, first_interval=heartbeat_interval, min_std_deviation=heartbeat_interval / 10.0,
+            acceptable_pause=phi_acceptable_pause)
+        # the messages sent to a node while it's being connected to are queued up to `max_queue_size` messages and
+        # `max_queue_bytes` bytes (which costs serializing each queued message one extra time); see `HubLogic`
         self._logic = HubLogic(nid, is_relay=is_relay,
                                heartbeat_interval=heartbeat_interval,
-                               heartbeat_max_silence=heartbeat_max_silence)
+                               heartbeat_max_silence=heartbeat_max_silence,
+                               heartbeat_jitter=heartbeat_jitter,
+                               failure_detector=failure_detector,
+                               max_queue_size=max_queue_size, max_queue_bytes=max_queue_bytes,
+                               queue_overflow=queue_overflow, size_of=self._size_of)
         self._ctx = zmq.Context()
         self._ctx.linger = 0
         self._insock = self._ctx.socket(zmq.ROUTER)
@@ -84,17 +175,19 @@ class Hub(object):
         self._watched_nodes = {}
         self._initialized = True
         self._start()
+        self._writer = spawn(self._write)
+        self._writer.link_exception(lambda _: self.stop())
 
     def _start(self):
         self._execute(self._logic.start)
 
     def send_message(self, nid, msg_h):
-        self._execute(self._logic.send_message, nid, msg_h, time.time())
+        self._enqueue(self._logic.send_message, nid, msg_h, time.time())
 
     def watch_node(self, nid, watch_handle):
         if nid not in self._watched_nodes:
             self._watched_nodes[nid] = set([watch_handle])
-            self._execute(self._logic.ensure_connected, nid, time.time())
+            self._enqueue(self._logic.ensure_connected, nid, time.time())
         else:
             self._watched_nodes[nid].add(watch_handle)
 
@@ -104,6 +197,11 @@ class Hub(object):
         except KeyError:
             pass
 
+    def queue_depths(self):
+        """Returns `{nid: (num_messages, num_bytes)}` for the nodes being connected to that have messages queued up."""
+        logic = self._logic
+        return dict((nid, logic.queue_depth(nid)) for nid, queue in logic.queues.items() if queue) if logic else {}
+
     def stop(self):
         self.stop = lambda: None
         self.send_message = lambda nid, msg_h: None
@@ -118,14 +216,30 @@ class Hub(object):
         if hasattr(self, '_listener_in'):
             self._listener_in.kill()
             self._listener_in = None
+        if getattr(self, '_writer', None):
+            self._writer.kill()
+            self._writer = None
+        if hasattr(self, '_connectors'):
+            self._connectors.kill()
+        if hasattr(self, '_resolver'):
+            self._resolver.stop()
         if hasattr(self, '_initialized'):
+            self._drain()  # not to lose anything sent just before stopping
             logic, self._logic = self._logic, None
             self._execute(logic.shutdown)
+            if self._batches:
+                self._flush_batches()
             sleep(.1)  # XXX: needed?
         if hasattr(self, '_ctx'):
             self._insock = self._outsock = None
             self._ctx.destroy(linger=0)
             self._ctx = None
+        if getattr(self, '_ipc_path', None):
+            try:
+                os.unlink(self._ipc_path)
+            except OSError:
+                pass
+            self._ipc_path = None
 
     def __del__(self):
         self.stop()
@@ -134,142 +248,408 @@ class Hub(object):
         return "Hub(%s)" % (self.nid,)
 
     def _listen(self, sock, on_sock):
-        recv, t, execute, message_received, ping_received, sig_disconnect_received = (
-            sock.recv_multipart, time.time, self._execute, self._logic.message_received, self._logic.ping_received, self._logic.sig_disconnect_received)
+        recv, received = sock.recv_multipart, self._received
         while True:
             try:
-                data = recv()
+                # without copying, so that large payloads are never duplicated on their way to the unpickler
+                data = recv(copy=False)
             except zmq.ZMQError as e:
                 if e.errno != errno.EINTR:  # Sometimes "Interrupted system call" happens on Linux. Nobody knows which signal is interrupting it.
                     raise
                 continue
+            if len(data) < 2:
+                continue  # malformed input
+            # any frames after the message are its out-of-band buffers; see `Codec.encode`
+            received(on_sock, data[0].bytes, buffer(data[1]), [buffer(x) for x in data[2:]])
+
+    def _received(self, on_sock, sender_nid, msg_bytes, buffers=()):
+        """Handles a frame received from `sender_nid`; `msg_bytes` is a `buffer`, which is only ever sliced into more
+        `buffer`s, so that the payload stays where the socket put it; slicing a `buffer` with `[]` copies.
+
+        """
+        execute = self._enqueue
+        # dbg("recv", repr(msg_bytes), "from", sender_nid)
+        msg_header, msg_bytes = msg_bytes[:4], buffer(msg_bytes, 4)
+        if msg_header == SIG_DISCONNECT:
+            assert not msg_bytes
+            execute(self._logic.sig_disconnect_received, sender_nid)
+        elif msg_header == SIG_NEW_RELAY:
+            assert not msg_bytes
+            execute(self._logic.new_relay_received, sender_nid)
+        elif msg_header == SIG_RELAY_CONNECT:
+            execute(self._logic.relay_connect_received, on_sock, relayer_nid=sender_nid, relayee_nid=msg_bytes[:])
+        elif msg_header == SIG_RELAY_CONNECTED:
+            execute(self._logic.relay_connected_received, relayee_nid=msg_bytes[:])
+        elif msg_header == SIG_RELAY_NODEDOWN:
+            execute(self._logic.relay_nodedown_received, relay_nid=sender_nid, relayee_nid=msg_bytes[:])
+        elif msg_header == SIG_RELAY_SEND:
             try:
-                sender_nid, msg_bytes = data
+                relayee_nid, relayed_bytes = _split_nid(msg_bytes)
             except ValueError:
-                continue  # malformed input
-            # dbg("recv", repr(msg_bytes), "from", sender_nid)
-            msg_header, msg_bytes = msg_bytes[:4], msg_bytes[4:]
-            if msg_header == SIG_DISCONNECT:
-                assert not msg_bytes
-                execute(sig_disconnect_received, sender_nid)
-            elif msg_header == SIG_NEW_RELAY:
-                assert not msg_bytes
-                self._logic.new_relay_received(sender_nid)
-            elif msg_header == SIG_RELAY_CONNECT:
-                execute(self._logic.relay_connect_received, on_sock, relayer_nid=sender_nid, relayee_nid=msg_bytes)
-            elif msg_header == SIG_RELAY_CONNECTED:
-                execute(self._logic.relay_connected_received, relayee_nid=msg_bytes)
-            elif msg_header == SIG_RELAY_NODEDOWN:
-                execute(self._logic.relay_nodedown_received, relay_nid=sender_nid, relayee_nid=msg_bytes)
-            elif msg_header == SIG_RELAY_SEND:
-                relayee_nid, relayed_bytes = msg_bytes.split('\0', 1)
-                execute(self._logic.relay_send_received, sender_nid, relayee_nid, relayed_bytes)
-            elif msg_header == SIG_RELAY_FORWARDED:
-                relayer_nid, relayed_bytes = msg_bytes.split('\0', 1)
-                execute(self._logic.relay_forwarded_received, relayer_nid, relayed_bytes)
-            elif msg_header == SIG_RELAY_NVM:
-                execute(self._logic.relay_nvm_received, sender_nid, relayee_nid=msg_bytes)
-            elif msg_header < MIN_VERSION_BITS:
-                continue  # malformed input
-            else:
+                return  # malformed input
+            execute(self._logic.relay_send_received, sender_nid, relayee_nid, relayed_bytes)
+        elif msg_header == SIG_RELAY_FORWARDED:
+            try:
+                relayer_nid, relayed_bytes = _split_nid(msg_bytes)
+            except ValueError:
+                return  # malformed input
+            execute(self._logic.relay_forwarded_received, relayer_nid, relayed_bytes)
+        elif msg_header == SIG_RELAY_NVM:
+            execute(self._logic.relay_nvm_received, sender_nid, relayee_nid=msg_bytes[:])
+        elif msg_header == SIG_RESET_PATHS:
+            self._reset_paths_out(sender_nid)
+        elif msg_header == SIG_BATCH:
+            pos, end = 0, len(msg_bytes)
+            while pos < end:
                 try:
-                    unpacked = struct.unpack(MSG_HEADER_FORMAT, msg_header)
+                    size, = struct.unpack_from(BATCH_ENTRY_FORMAT, msg_bytes, pos)
                 except Exception:
-                    continue  # malformed input
-                version = unpacked[0] - MIN_VERSION_VALUE
-                if msg_bytes:
-                    execute(message_received, on_sock, sender_nid, version, msg_bytes, t())
-                else:
-                    execute(ping_received, on_sock, sender_nid, version, t())
+                    return  # malformed input
+                pos += 4
+                frame = buffer(msg_bytes, pos, size)
+                pos += size
+                if frame[:4] != SIG_BATCH:  # batches can't be nested
+                    self._received(on_sock, sender_nid, frame)
+        elif msg_header == SIG_COMPRESSED:
+            msg_header = msg_bytes[:4]
+            if len(msg_header) < 4 or msg_header < MIN_VERSION_BITS:
+                return  # malformed input
+            try:
+                msg_bytes = self._decompress(buffer(msg_bytes, 4))
+            except zlib.error:
+                return  # malformed input
+            self._message_received(on_sock, sender_nid, msg_header, msg_bytes, buffers)
+        elif msg_header < MIN_VERSION_BITS:
+            return  # malformed input
+        else:
+            self._message_received(on_sock, sender_nid, msg_header, msg_bytes, buffers)
+
+    def _message_received(self, on_sock, sender_nid, msg_header, msg_bytes, buffers):
+        execute = self._enqueue
+        try:
+            unpacked = struct.unpack(MSG_HEADER_FORMAT, msg_header)
+        except Exception:
+            return  # malformed input
+        version = unpacked[0] - MIN_VERSION_VALUE
+        if msg_bytes[:1] == CAPABILITIES_MARKER:
+            execute(self._ping_with_capabilities_received, on_sock, sender_nid, version, msg_bytes[1:2], time.time())
+        elif msg_bytes:
+            # the buffers just tag along with the bytes through `HubLogic` and are unpacked again at `Receive`
+            execute(self._logic.message_received, on_sock, sender_nid, version, (msg_bytes, buffers) if buffers else msg_bytes, time.time())
+        else:
+            execute(self._logic.ping_received, on_sock, sender_nid, version, time.time())
+
+    def _ping_with_capabilities_received(self, on_sock, sender_nid, version, capabilities, t):
+        self._execute(self._logic.ping_received, on_sock, sender_nid, version, t)
+        # only now, as the ping might have told us that the node has restarted, and forget about it (`NodeDown`)
+        if capabilities and ord(capabilities) & CAP_ZLIB:
+            self._zlib_peers.add(sender_nid)
+        else:
+            self._zlib_peers.discard(sender_nid)
+
+    def _enqueue(self, fn, *args):
+        self._queue.append((fn, args))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _write(self):
+        wakeup, drain = self._wakeup, self._drain
+        while True:
+            wakeup.wait()
+            wakeup.clear()
+            drain()
+
+    def _drain(self):
+        queue, execute = self._queue, self._execute
+        while queue:
+            fn, args = queue.popleft()
+            try:
+                execute(fn, *args)
+            except Exception as e:  # not to take down the writer, and with it the hub, over any one thing gone wrong
+                err("%s\n%s" % (e, traceback.format_exc()))
+        # with batching, everything sent while the writer was busy goes out together
+        if self._batches:
+            self._flush_batches()
 
     def _execute(self, fn, *args, **kwargs):
+        """Carries out the actions of `fn`, a method of `HubLogic`; only ever called by the writer greenlet, or when the hub
+        is starting or stopping.
+
+        """
         g = fn(*args, **kwargs)
         if g is None:
             return
-        insock_send, outsock_send, on_receive = self._insock.send_multipart, self._outsock.send_multipart, self._on_receive
-        with self._lock:
-            for action in flatten(g):
-                cmd = action[0]
-                # if cmd not in (NextBeat,):
-                #     dbg("%s -> %s: %s" % (fn.__name__.ljust(25), cmd, ", ".join(repr(x) for x in action[1:])))
-                if cmd is Send:
-                    _, use_sock, nid, version, msg_h = action
-                    (outsock_send if use_sock == OUT else insock_send)((nid, struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version) + msg_h.serialize()))
-                elif cmd is Receive:
-                    _, sender_nid, msg_bytes = action
-                    on_receive(sender_nid, msg_bytes)
-                elif cmd is RelaySend:
-                    _, use_sock, relay_nid, relayee_nid, msg_h = action
-                    (outsock_send if use_sock == OUT else insock_send)((relay_nid, SIG_RELAY_SEND + relayee_nid + '\0' + msg_h.serialize()))
-                elif cmd is RelayForward:
-                    _, use_sock, recipient_nid, relayer_nid, relayed_bytes = action
-                    (outsock_send if use_sock == OUT else insock_send)((recipient_nid, SIG_RELAY_FORWARDED + relayer_nid + '\0' + relayed_bytes))
-                elif cmd is Ping:
-                    _, use_sock, nid, version = action
-                    (outsock_send if use_sock == OUT else insock_send)((nid, struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version)))
-                elif cmd is NextBeat:
-                    _, time_to_next = action
-                    if self._heartbeater is not _DELETED:
-                        self._heartbeater = spawn_later(time_to_next, self._heartbeat)
-                elif cmd is RelaySigNew:
-                    _, use_sock, nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((nid, SIG_NEW_RELAY))
-                elif cmd is RelayConnect:
-                    _, use_sock, relay_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relay_nid, SIG_RELAY_CONNECT + relayee_nid))
-                elif cmd is RelaySigConnected:
-                    _, use_sock, relayer_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relayer_nid, SIG_RELAY_CONNECTED + relayee_nid))
-                elif cmd is RelaySigNodeDown:
-                    _, use_sock, relayer_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relayer_nid, SIG_RELAY_NODEDOWN + relayee_nid))
-                elif cmd is RelayNvm:
-                    _, use_sock, relay_nid, relayee_nid = action
-                    (outsock_send if use_sock == OUT else insock_send)((relay_nid, SIG_RELAY_NVM + relayee_nid))
-                elif cmd is SendFailed:
-                    _, msg_h = action
-                    msg_h.send_failed()
-                elif cmd is SigDisconnect:
-                    _, use_sock, nid = action
-                    (outsock_send if use_sock == OUT else insock_send)([nid, SIG_DISCONNECT])
-                elif cmd is NodeDown:
-                    _, nid = action
-                    for watch_handle in self._watched_nodes.pop(nid, []):
-                        self._on_node_down(watch_handle, nid)
-                elif cmd is Connect:
-                    _, naddr = action
-                    if naddr not in self.FAKE_INACCESSIBLE_NADDRS:
-                        zmqaddr = naddr_to_zmq_endpoint(naddr)
-                        if zmqaddr:
-                            self._outsock.connect(zmqaddr)
-                    sleep(0.001)
-                elif cmd is Disconnect:
-                    _, naddr = action
-                    if naddr not in self.FAKE_INACCESSIBLE_NADDRS:
-                        zmqaddr = naddr_to_zmq_endpoint(naddr)
-                        if zmqaddr:
-                            try:
-                                self._outsock.disconnect(zmqaddr)
-                            except zmq.ZMQError:
-                                pass
-                elif cmd is Bind:
-                    _, naddr = action
-                    zmqaddr = naddr_to_zmq_endpoint(naddr)
-                    if not zmqaddr:
-                        raise Exception("Failed to bind to %s" % (naddr,))
-                    self._insock.bind(zmqaddr)
+        send, on_receive = self._send, self._on_receive
+        for action in flatten(g):
+            cmd = action[0]
+            # if cmd not in (NextBeat,):
+            #     dbg("%s -> %s: %s" % (fn.__name__.ljust(25), cmd, ", ".join(repr(x) for x in action[1:])))
+            if cmd is Send:
+                _, use_sock, nid, version, msg_h = action
+                buffers = []
+                paths = self._paths_out.get((use_sock, nid))
+                if paths is None:
+                    paths = self._paths_out[use_sock, nid] = PathTable()
+                body = self._serialize(msg_h, buffers, paths)
+                if body is None:
+                    continue
+                header = struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version)
+                if (self.compression_threshold is not None and len(body) >= self.compression_threshold and
+                        nid in self._zlib_peers):
+                    frame = self._compress(header, body)
                 else:
-                    assert False, "unknown command: %r" % (cmd,)
+                    frame = header + body
+                if buffers:  # can't be batched
+                    if self._batches:
+                        self._flush_batch((use_sock, nid))
+                    # pyzmq sends frames of at least `zmq.COPY_THRESHOLD` bytes right out of the buffers without copying
+                    # them; see `BinaryCodec` about not changing them afterwards
+                    send(use_sock, [nid, frame] + buffers, copy=False)
+                elif self._batches is None:
+                    send(use_sock, (nid, frame))
+                else:
+                    self._add_to_batch(use_sock, nid, frame)
+            elif cmd is Receive:
+                _, on_sock, sender_nid, msg_bytes = action
+                buffers = ()
+                if type(msg_bytes) is tuple:  # with out-of-band buffers; see `_received`
+                    msg_bytes, buffers = msg_bytes
+                paths = None
+                if on_sock is not None:  # relayed messages don't use tables
+                    paths = self._paths_in.get((on_sock, sender_nid))
+                    if paths is None:
+                        paths = self._paths_in[on_sock, sender_nid] = PathTable()
+                try:
+                    on_receive(sender_nid, msg_bytes, buffers, paths)
+                except UnknownPath:
+                    # the sender starts over with both of its tables, and so do we, not to keep anything stale around
+                    self._paths_in.pop((IN, sender_nid), None)
+                    self._paths_in.pop((OUT, sender_nid), None)
+                    self._execute(self._logic.path_unknown, sender_nid)
+            elif cmd is RelaySend:
+                _, use_sock, relay_nid, relayee_nid, msg_h = action
+                body = self._serialize(msg_h)
+                if body is not None:
+                    send(use_sock, (relay_nid, SIG_RELAY_SEND + relayee_nid + '\0' + body))
+            elif cmd is RelayForward:
+                _, use_sock, recipient_nid, relayer_nid, relayed_bytes = action
+                send(use_sock, (recipient_nid, SIG_RELAY_FORWARDED + relayer_nid + '\0' + str(relayed_bytes)))
+            elif cmd is Ping:
+                _, use_sock, nid, version = action
+                if self._batches:  # versions must arrive in order
+                    self._flush_batch((use_sock, nid))
+                send(use_sock, (nid, struct.pack(MSG_HEADER_FORMAT, MIN_VERSION_VALUE + version) + self._capabilities))
+            elif cmd is NextBeat:
+                _, time_to_next = action
+                if self._heartbeater is not _DELETED:
+                    self._heartbeater = spawn_later(time_to_next, self._heartbeat)
+            elif cmd is RelaySigNew:
+                _, use_sock, nid = action
+                send(use_sock, (nid, SIG_NEW_RELAY))
+            elif cmd is RelayConnect:
+                _, use_sock, relay_nid, relayee_nid = action
+                send(use_sock, (relay_nid, SIG_RELAY_CONNECT + relayee_nid))
+            elif cmd is RelaySigConnected:
+                _, use_sock, relayer_nid, relayee_nid = action
+                send(use_sock, (relayer_nid, SIG_RELAY_CONNECTED + relayee_nid))
+            elif cmd is RelaySigNodeDown:
+                _, use_sock, relayer_nid, relayee_nid = action
+                send(use_sock, (relayer_nid, SIG_RELAY_NODEDOWN + relayee_nid))
+            elif cmd is RelayNvm:
+                _, use_sock, relay_nid, relayee_nid = action
+                send(use_sock, (relay_nid, SIG_RELAY_NVM + relayee_nid))
+            elif cmd is SendFailed:
+                _, msg_h = action
+                msg_h.send_failed()
+            elif cmd is SigResetPaths:
+                _, use_sock, nid = action
+                send(use_sock, (nid, SIG_RESET_PATHS))
+            elif cmd is SigDisconnect:
+                _, use_sock, nid = action
+                if self._batches:
+                    self._flush_batch((use_sock, nid))
+                send(use_sock, [nid, SIG_DISCONNECT])
+            elif cmd is NodeDown:
+                _, nid = action
+                # including when it has restarted, which `HubLogic` tells by its versions starting over
+                self._reset_paths_out(nid)
+                self._paths_in.pop((IN, nid), None)
+                self._paths_in.pop((OUT, nid), None)
+                self._zlib_peers.discard(nid)  # it might have come back as an older version
+                for watch_handle in self._watched_nodes.pop(nid, []):
+                    self._on_node_down(watch_handle, nid)
+            elif cmd is Connect:
+                _, naddr = action
+                if naddr not in self.FAKE_INACCESSIBLE_NADDRS and naddr not in self._connecting:
+                    self._connecting[naddr] = []
+                    self._connectors.spawn(self._connect, naddr)
+            elif cmd is Disconnect:
+                _, naddr = action
+                self._connecting.pop(naddr, None)
+                zmqaddr = self._endpoints.pop(naddr, None)
+                if zmqaddr:
+                    try:
+                        self._outsock.disconnect(zmqaddr)
+                    except zmq.ZMQError:
+                        pass
+            elif cmd is Bind:
+                _, naddr = action
+                zmqaddr = naddr_to_zmq_endpoint(naddr, self._resolver.resolve)
+                if not zmqaddr:
+                    raise Exception("Failed to bind to %s" % (naddr,))
+                self._insock.bind(zmqaddr)
+                if self.ipc_dir:
+                    self._ipc_path = ipc_path(self.ipc_dir, self.nid)
+                    with _hwm(self._insock, IPC_HWM):  # the pipes of the connections accepted inherit it
+                        self._insock.bind('ipc://' + self._ipc_path)
+                    self._local_ips = local_addresses()
+            else:
+                assert False, "unknown command: %r" % (cmd,)
+
+    def _serialize(self, msg_h, buffers=None, paths=None):
+        """Returns the bytes of `msg_h`, or `None` if it can't be serialized, in which case it's dead-lettered; the writer
+        serializes everything that's sent, so it mustn't choke on a message that can't be.
+
+        """
+        try:
+            return msg_h.serialize(buffers, paths)
+        except Exception as e:
+            err("Failed to serialize %r: %s\n%s" % (msg_h, e, traceback.format_exc()))
+            msg_h.send_failed()
+            return None
+
+    def _size_of(self, msg_h):
+        try:
+            return len(msg_h.serialize())
+        except Exception:
+            return 0  # it's dead-lettered once it's sent
+
+    def _reset_paths_out(self, nid):
+        # the tables are kept, only moved on to their next epochs, in case the node still has its tables from this one
+        for sock in (IN, OUT):
+            paths = self._paths_out.get((sock, nid))
+            if paths is not None:
+                paths.start_over()
+
+    def _compress(self, header, body):
+        stats, t0 = self.stats, time.clock()
+        compressed = zlib.compress(body, self.compression_level)
+        stats.compression_time += time.clock() - t0
+        if len(compressed) >= len(body):
+            return header + body  # incompressible; not worth decompressing on the other end
+        stats.messages_compressed += 1
+        stats.bytes_before_compression += len(body)
+        stats.bytes_after_compression += len(compressed)
+        return SIG_COMPRESSED + header + compressed
+
+    def _decompress(self, data):
+        stats, t0 = self.stats, time.clock()
+        ret = zlib.decompress(data)
+        stats.decompression_time += time.clock() - t0
+        stats.messages_decompressed += 1
+        return ret
+
+    def _add_to_batch(self, use_sock, nid, frame):
+        key, batches = (use_sock, nid), self._batches
+        batch = batches.get(key)
+        if batch is not None and (len(batch) >= self.max_batch_size or
+                                  self._batch_bytes[key] + len(frame) > self.max_batch_bytes):
+            self._flush_batch(key)
+            batch = None
+        if batch is None:
+            batches[key] = [frame]
+            self._batch_bytes[key] = len(frame)
+        else:
+            batch.append(frame)
+            self._batch_bytes[key] += len(frame)
+
+    def _flush_batch(self, key):
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        del self._batch_bytes[key]
+        use_sock, nid = key
+        if len(batch) == 1:
+            frame, = batch
+        else:
+            frame = SIG_BATCH + ''.join(struct.pack(BATCH_ENTRY_FORMAT, len(x)) + x for x in batch)
+        self._send(use_sock, (nid, frame))
+
+    def _flush_batches(self):
+        for key in self._batches.keys():
+            self._flush_batch(key)
+
+    def _send(self, use_sock, frames, copy=True):
+        """Sends `frames`, the first of which is the nid of the recipient, or holds them back until the node is connected."""
+        if use_sock == IN:
+            self._insock.send_multipart(frames, copy=copy)
+        elif self._connecting and nid2addr(frames[0]) in self._connecting:
+            self._connecting[nid2addr(frames[0])].append((frames, copy))
+        else:
+            self._outsock.send_multipart(frames, copy=copy)
+
+    def _connect(self, naddr):
+        # in a greenlet of its own, so that resolving the address doesn't hold up sending to the nodes already connected
+        try:
+            zmqaddr = naddr_to_zmq_endpoint(naddr, self._resolver.resolve, self.ipc_dir, self._local_ips)
+            if zmqaddr and self._outsock is not None and naddr in self._connecting:
+                with _hwm(self._outsock, IPC_HWM if zmqaddr.startswith('ipc://') else None):
+                    self._outsock.connect(zmqaddr)
+                self._endpoints[naddr] = zmqaddr
+                sleep(0.001)  # for the connection to be set up before anything is sent over it
+        except Exception as e:
+            # like with a node that can't be resolved, it's told down by the heartbeat, and connected to anew after that
+            err("Failed to connect to %s: %s\n%s" % (naddr, e, traceback.format_exc()))
+        finally:
+            # whatever happened, so that nothing sent to it is held back forever, and it can be connected to again
+            self._enqueue(self._connected, naddr)
+
+    def _connected(self, naddr):
+        for frames, copy in self._connecting.pop(naddr, []):
+            self._outsock.send_multipart(frames, copy=copy)
 
     def _heartbeat(self):
-        self._execute(self._logic.heartbeat, time.time())
+        self._enqueue(self._logic.heartbeat, time.time())
 verifyClass(IHub, Hub)
 
 
+@contextmanager
+def _hwm(sock, hwm):
+    """Has the pipes created while in the block have the high-water mark of `hwm` in both directions, if not `None`."""
+    if hwm is None:
+        yield
+        return
+    prev = sock.sndhwm, sock.rcvhwm
+    sock.sndhwm = sock.rcvhwm = hwm
+    try:
+        yield
+    finally:
+        sock.sndhwm, sock.rcvhwm = prev
+
+
+def _split_nid(buf):
+    """Splits `buf` into the '\\0'-terminated nid it starts with and a `buffer` of the rest."""
+    head = buf[:256]  # enough for any sane nid; no need to copy the rest
+    i = head.find('\0')
+    if i == -1:
+        head = buf[:]
+        i = head.index('\0')
+    return head[:i], buffer(buf, i + 1)
+
+
 EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION = -3  # no EAI_... in socket for this errno
 
 
-def naddr_to_zmq_endpoint(nid):
+def naddr_to_zmq_endpoint(nid, resolve=gethostbyname, ipc_dir=None, local_ips=()):
+    """Returns the ZeroMQ endpoint of the node at `nid`, or `None` if it can't be resolved.
+
+    With an `ipc_dir`, nodes on this host (at a loopback address or one of `local_ips`) that are listening on a Unix
+    domain socket in it are reached over that; all other nodes over TCP, including those that have left their socket
+    behind when they crashed. Sockets are named after the whole nid of their node, not just its port, so that a node is
+    never mistaken for another one at the same port, e.g. at another address sharing the directory; that also means
+    that only nodes referred to by their own nids are reached over them.
+
+    """
     if '\0' in nid:
         return None
     try:
@@ -277,9 +657,42 @@ def naddr_to_zmq_endpoint(nid):
     except ValueError:
         return None
     try:
-        return 'tcp://%s:%s' % (gethostbyname(host), port)
+        ip = resolve(host)
+        if ipc_dir and (ip.startswith('127.') or ip in local_ips):
+            path = ipc_path(ipc_dir, nid)
+            if _is_listening(path):
+                return 'ipc://' + path
+        return 'tcp://%s:%s' % (ip, port)
     except socket.gaierror as e:
         # XXX: perhaps we should retry in a few sec in case of EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION?
         if e.errno not in (socket.EAI_NONAME, EAI_ERRNO_TEMPORARY_FAILURE_IN_NAME_RESOLUTION):
             err("%s\n%s" % (e, traceback.format_exc()))
     return None
+
+
+def ipc_path(ipc_dir, nid):
+    """Returns the path of the Unix domain socket of the node `nid` on this host."""
+    return os.path.join(ipc_dir, 'spinoff-%s' % (nid,))
+
+
+def _is_listening(path):
+    """Tells whether a node is listening on the Unix domain socket at `path`, which might also not exist at all, or be
+    left over from a node that has crashed.
+
+    """
+    sock = gsocket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def local_addresses():
+    """Returns the addresses of this host, as far as its host name tells."""
+    try:
+        return set(gethostbyname_ex(socket.gethostname())[2])
+    except socket.gaierror:
+        return set()
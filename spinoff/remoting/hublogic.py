@@ -1,7 +1,9 @@
 from __future__ import print_function
 
 import sys
+import heapq
 import random
+from collections import deque
 from types import GeneratorType
 
 from spinoff.util.python import enumrange
@@ -11,13 +13,16 @@ from spinoff.util.logging import dbg
 (
     Bind, Connect, Disconnect, SigDisconnect, Send, Ping,
     RelaySigNew, RelayConnect, RelaySigConnected, RelaySend, RelayForward, RelaySigNodeDown, RelayNvm,
-    Receive, SendFailed, NodeDown, NextBeat
+    Receive, SendFailed, NodeDown, NextBeat, SigResetPaths
 ) = enumrange(
     'Bind', 'Connect', 'Disconnect', 'SigDisconnect', 'Send', 'Ping',
     'RelaySigNew', 'RelayConnect', 'RelaySigConnected', 'RelaySend', 'RelayForward', 'RelaySigNodeDown', 'RelayNvm',
-    'Receive', 'SendFailed', 'NodeDown', 'NextBeat'
+    'Receive', 'SendFailed', 'NodeDown', 'NextBeat', 'SigResetPaths'
 )
 IN, OUT = enumrange('IN', 'OUT')
+# what to do with a message to a node that is being connected to and whose queue is full; like with mailboxes, except
+# that `DEAD_LETTER` fails the message with `SendFailed`, which the node reports as a dead letter
+DROP_NEWEST, DROP_OLDEST, DEAD_LETTER = enumrange('DROP_NEWEST', 'DROP_OLDEST', 'DEAD_LETTER')
 BIG_BANG_T = -sys.maxint
 
 
@@ -26,7 +31,7 @@ def nid2addr(nid):
 
 
 def FLUSH(self, nid):
-    for msg_h in self.queues.pop(nid, []):
+    for msg_h in self._pop_queue(nid, ()):
         yield SendFailed, msg_h
 
 
@@ -35,6 +40,8 @@ def NODEDOWN(self, nid):
     yield NodeDown, nid
     for x in [self.last_seen, self.last_sent, self.versions]:
         x.pop(nid, None)
+    if self.failure_detector is not None:
+        self.failure_detector.remove(nid)
 
 
 def RELAY_NODEDOWN_CHECKS(self, nid):
@@ -62,10 +69,21 @@ class HubLogic(object):
     initialization.
 
     """
-    def __init__(self, nid, heartbeat_interval, heartbeat_max_silence, is_relay=False):
+    def __init__(self, nid, heartbeat_interval, heartbeat_max_silence, is_relay=False, heartbeat_jitter=0.0,
+                 failure_detector=None, max_queue_size=None, max_queue_bytes=None, queue_overflow=DEAD_LETTER,
+                 size_of=None):
         self.nid = nid
         self.heartbeat_interval = heartbeat_interval
         self.heartbeat_max_silence = heartbeat_max_silence
+        # with jitter, each node is pinged after `heartbeat_interval` give or take this fraction of it, and heartbeats
+        # happen whenever the next node is due instead of every `heartbeat_interval`, so that pings are spread out
+        self.heartbeat_jitter = heartbeat_jitter
+        # when to check on each connected node next: (t, nid); only the nodes that are due are looked at on a heartbeat
+        self.deadlines = []
+        self.scheduled = set()
+        # e.g. a `PhiAccrualFailureDetector`, which learns from the pings of each node when it's to be considered down;
+        # without one, or until a node has pinged us, that's after `heartbeat_max_silence`
+        self.failure_detector = failure_detector
         self.is_relay = is_relay
         self.channels_in = set()
         self.channels_out = set()
@@ -73,6 +91,17 @@ class HubLogic(object):
         self.last_sent = {}
         self.versions = {}
         self.queues = {}
+        # the messages to a node being connected to are queued up to `max_queue_size` messages and `max_queue_bytes`
+        # bytes, as told by `size_of(msg_h)`; beyond that, `queue_overflow` applies
+        if queue_overflow not in (DROP_NEWEST, DROP_OLDEST, DEAD_LETTER):
+            raise ValueError("unsupported queue overflow policy: %r" % (queue_overflow,))
+        if max_queue_bytes is not None and size_of is None:
+            raise TypeError("max_queue_bytes requires size_of")
+        self.max_queue_size, self.max_queue_bytes = max_queue_size, max_queue_bytes
+        self.queue_overflow, self.size_of = queue_overflow, size_of
+        self.queue_bytes = {}  # nid => the total size of its queue, with `max_queue_bytes`
+        self.queue_sizes = {}  # nid => the size of each message in its queue, ditto
+        self.queue_overflows = 0  # the number of messages dropped or failed because of a full queue
         self.rl_relayees = {}      # relayee_nid => relayer_nid
         self.rl_relayers = {}      # relayer_nid => [relayee_nid]
         self.cl_avail_relays = {}  # relay_nid => [relayee_nid]
@@ -93,9 +122,9 @@ class HubLogic(object):
             if rcpt_nid not in self.queues:
                 yield Send, OUT, rcpt_nid, self._next_version(), msg_h
             else:
-                self.queues[rcpt_nid].append(msg_h)
+                yield self._queue(rcpt_nid, msg_h)
         elif rcpt_nid in self.queues:
-            self.queues[rcpt_nid].append(msg_h)
+            yield self._queue(rcpt_nid, msg_h)
         elif rcpt_nid in self.cl_relayees:
             relay_nid = self.cl_relayees[rcpt_nid]
             yield RelaySend, (IN if relay_nid in self.channels_in else OUT), relay_nid, rcpt_nid, msg_h
@@ -103,7 +132,8 @@ class HubLogic(object):
             self.last_sent[rcpt_nid] = t
             self.channels_out.add(rcpt_nid)
             self.last_seen[rcpt_nid] = t
-            self.queues.setdefault(rcpt_nid, []).append(msg_h)
+            self._schedule(rcpt_nid, t)
+            yield self._queue(rcpt_nid, msg_h)
             yield Connect, nid2addr(rcpt_nid)
             yield Ping, OUT, rcpt_nid, self._next_version()
             if self.is_relay:
@@ -125,42 +155,31 @@ class HubLogic(object):
         yield NODEDOWN(self, sender_nid)
 
     def ping_received(self, on_sock, sender_nid, version, t):
-        if on_sock == OUT and sender_nid not in self.channels_out:
-            return
-        self.last_seen[sender_nid] = t
-        if on_sock == IN and sender_nid not in self.channels_in:
-            self.channels_in.add(sender_nid)
-            if self.is_relay:
-                yield RelaySigNew, IN, sender_nid
-            elif sender_nid in self.cl_relayees:
-                relay_nid = self.cl_relayees.pop(sender_nid)
-                self.cl_avail_relays[relay_nid].remove(sender_nid)
-                yield RelayNvm, (IN if relay_nid in self.channels_in else OUT), relay_nid, sender_nid
-        inout = (IN if sender_nid in self.channels_in else OUT)
-        if self._needs_ping(sender_nid, t):
-            yield Ping, inout, sender_nid, self._next_version()
-        if sender_nid in self.queues:
-            for msg_h in self.queues.pop(sender_nid):
-                yield Send, inout, sender_nid, self._next_version(), msg_h
-        else:
-            if not (version > self.versions.get(sender_nid, -1)):
-                # version has been reset--he has restarted, so emulate a node-down-node-back-up event pair:
-                self.versions[sender_nid] = version
-                assert sender_nid not in self.queues
-                if sender_nid in self.cl_avail_relays:
-                    self._handle_relay_down(sender_nid)
-                yield NodeDown, sender_nid
-        self.versions[sender_nid] = version
+        return self._seen(on_sock, sender_nid, version, t, is_ping=True)
 
     def message_received(self, on_sock, sender_nid, version, msg_body_bytes, t):
-        yield self.ping_received(on_sock, sender_nid, version, t)
+        yield self._seen(on_sock, sender_nid, version, t, is_ping=False)
         if msg_body_bytes:
-            yield Receive, sender_nid, msg_body_bytes
+            yield Receive, on_sock, sender_nid, msg_body_bytes
+
+    def path_unknown(self, sender_nid):
+        # the sender referred to a path by an ID we don't know, e.g. because we've restarted or the message that came
+        # with the path got lost; NodeDown takes care of the restarts we notice, but either way, ask it to start over
+        if sender_nid in self.channels_in:
+            yield SigResetPaths, IN, sender_nid
+        elif sender_nid in self.channels_out:
+            yield SigResetPaths, OUT, sender_nid
 
     def heartbeat(self, t):
-        t_gone = t - self.heartbeat_max_silence
-        for nid in (self.channels_in | self.channels_out):
-            if self.last_seen[nid] <= t_gone:
+        deadlines, due = self.deadlines, []
+        while deadlines and deadlines[0][0] <= t:
+            _, nid = heapq.heappop(deadlines)
+            self.scheduled.discard(nid)
+            due.append(nid)
+        for nid in due:
+            if nid not in self.channels_in and nid not in self.channels_out:
+                continue  # already gone
+            elif self._is_down(nid, t):
                 if nid in self.channels_out:
                     self.channels_out.remove(nid)
                 if nid in self.channels_in:
@@ -180,7 +199,8 @@ class HubLogic(object):
             else:
                 if self._needs_ping(nid, t):
                     yield Ping, (IN if nid in self.channels_in else OUT), nid, self._next_version()
-        yield NextBeat, self.heartbeat_interval
+                self._schedule(nid, t)
+        yield NextBeat, self._time_to_next_beat(t)
 
     def new_relay_received(self, nid):
         self.cl_avail_relays[nid] = set()
@@ -197,7 +217,7 @@ class HubLogic(object):
     def relay_connected_received(self, relayee_nid):
         if relayee_nid in self.cl_relayees:
             relay_nid = self.cl_relayees[relayee_nid]
-            for msg_h in self.queues.pop(relayee_nid, []):
+            for msg_h in self._pop_queue(relayee_nid, ()):
                 yield RelaySend, (IN if relay_nid in self.channels_in else OUT), relay_nid, relayee_nid, msg_h
 
     def relay_nodedown_received(self, relay_nid, relayee_nid):
@@ -215,7 +235,7 @@ class HubLogic(object):
         yield RelayForward, IN, relayee_nid, relayer_nid, relayed_bytes
 
     def relay_forwarded_received(self, actual_sender_nid, relayed_bytes):
-        yield Receive, actual_sender_nid, relayed_bytes
+        yield Receive, None, actual_sender_nid, relayed_bytes  # not over a connection of its own
 
     def relay_nvm_received(self, sender_nid, relayee_nid):
         self.rl_relayees.get(relayee_nid, set()).discard(sender_nid)
@@ -226,13 +246,21 @@ class HubLogic(object):
         if nid not in self.channels_in and nid not in self.channels_out and nid not in self.cl_relayees:
             self.last_seen[nid] = t
             self.channels_out.add(nid)
-            self.queues[nid] = []
+            self.queues[nid] = deque()
             yield Connect, nid2addr(nid)
             self.last_sent[nid] = t
+            self._schedule(nid, t)
             yield Ping, OUT, nid, self._next_version()
             if self.is_relay:
                 yield RelaySigNew, OUT, nid
 
+    def queue_depth(self, nid):
+        """Returns the number of messages queued up for `nid` while it's being connected to, and their total size if
+        `max_queue_bytes` is set.
+
+        """
+        return len(self.queues.get(nid, ())), self.queue_bytes.get(nid, 0) if self.max_queue_bytes is not None else None
+
     def shutdown(self):
         for nid in (self.channels_in | self.channels_out):
             yield SigDisconnect, (IN if nid in self.channels_in else OUT), nid
@@ -241,11 +269,102 @@ class HubLogic(object):
 
     # private:
 
+    def _seen(self, on_sock, sender_nid, version, t, is_ping):
+        if on_sock == OUT and sender_nid not in self.channels_out:
+            return
+        self.last_seen[sender_nid] = t
+        if is_ping and self.failure_detector is not None:
+            # only pings, which arrive at a steady pace, unlike messages
+            self.failure_detector.heartbeat(sender_nid, t)
+        if on_sock == IN and sender_nid not in self.channels_in:
+            self.channels_in.add(sender_nid)
+            self._schedule(sender_nid, t)
+            if self.is_relay:
+                yield RelaySigNew, IN, sender_nid
+            elif sender_nid in self.cl_relayees:
+                relay_nid = self.cl_relayees.pop(sender_nid)
+                self.cl_avail_relays[relay_nid].remove(sender_nid)
+                yield RelayNvm, (IN if relay_nid in self.channels_in else OUT), relay_nid, sender_nid
+        inout = (IN if sender_nid in self.channels_in else OUT)
+        if self._needs_ping(sender_nid, t):
+            yield Ping, inout, sender_nid, self._next_version()
+        if sender_nid in self.queues:
+            for msg_h in self._pop_queue(sender_nid):
+                yield Send, inout, sender_nid, self._next_version(), msg_h
+        else:
+            if not (version > self.versions.get(sender_nid, -1)):
+                # version has been reset--he has restarted, so emulate a node-down-node-back-up event pair:
+                self.versions[sender_nid] = version
+                assert sender_nid not in self.queues
+                if sender_nid in self.cl_avail_relays:
+                    self._handle_relay_down(sender_nid)
+                yield NodeDown, sender_nid
+        self.versions[sender_nid] = version
+
+    def _queue(self, nid, msg_h):
+        queue = self.queues.get(nid)
+        if queue is None:
+            queue = self.queues[nid] = deque()
+        max_size, max_bytes = self.max_queue_size, self.max_queue_bytes
+        size = nbytes = 0
+        if max_bytes is not None:
+            size = self.size_of(msg_h)
+            sizes = self.queue_sizes.setdefault(nid, deque())
+            nbytes = self.queue_bytes.get(nid, 0) + size
+        if max_size is not None and len(queue) >= max_size or max_bytes is not None and nbytes > max_bytes:
+            self.queue_overflows += 1
+            if self.queue_overflow is DEAD_LETTER:
+                yield SendFailed, msg_h
+                return
+            elif self.queue_overflow is DROP_NEWEST or max_bytes is not None and size > max_bytes:
+                return
+            while max_size is not None and len(queue) >= max_size or max_bytes is not None and nbytes > max_bytes:
+                queue.popleft()
+                if max_bytes is not None:
+                    nbytes -= sizes.popleft()
+        queue.append(msg_h)
+        if max_bytes is not None:
+            sizes.append(size)
+            self.queue_bytes[nid] = nbytes
+
+    def _pop_queue(self, nid, *default):
+        self.queue_bytes.pop(nid, None)
+        self.queue_sizes.pop(nid, None)
+        return self.queues.pop(nid, *default)
+
     def _handle_relay_down(self, relay_nid):
         for relayee_nid in self.cl_avail_relays.pop(relay_nid):
             del self.cl_relayees[relayee_nid]
             yield NODEDOWN(self, relayee_nid)
 
+    def _schedule(self, nid, t):
+        # a node still scheduled from before it was last disconnected is due earlier than now needed, which is harmless
+        if nid in self.scheduled:
+            return
+        interval = self.heartbeat_interval
+        if self.heartbeat_jitter:
+            interval *= 1.0 + self.heartbeat_jitter * (2.0 * random.random() - 1.0)
+        deadline = min(self.last_sent.get(nid, t) + interval, self._time_of_failure(nid))
+        heapq.heappush(self.deadlines, (deadline, nid))
+        self.scheduled.add(nid)
+
+    def _is_down(self, nid, t):
+        detector = self.failure_detector
+        if detector is not None and nid in detector:
+            return not detector.is_available(nid, t)
+        return self.last_seen[nid] <= t - self.heartbeat_max_silence
+
+    def _time_of_failure(self, nid):
+        detector = self.failure_detector
+        if detector is not None and nid in detector:
+            return detector.time_of_failure(nid)
+        return self.last_seen[nid] + self.heartbeat_max_silence
+
+    def _time_to_next_beat(self, t):
+        if not self.heartbeat_jitter or not self.deadlines:
+            return self.heartbeat_interval
+        return min(max(self.deadlines[0][0] - t, self.heartbeat_interval / 10.0), self.heartbeat_interval)
+
     def _needs_ping(self, nid, t):
         ret = self.last_sent.get(nid, BIG_BANG_T) <= t - self.heartbeat_interval / 3.0
         if ret:
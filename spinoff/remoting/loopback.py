@@ -0,0 +1,116 @@
+import traceback
+from collections import deque
+
+from zope.interface import implements
+from zope.interface.verify import verifyClass
+from gevent import spawn
+from gevent.event import Event
+
+from spinoff.remoting.hub import IHub
+from spinoff.util.logging import err
+
+
+__all__ = ['LoopbackHub']
+
+
+_NODES = {}  # nid => the `LoopbackHub` of every node in this process that has one, unless given a registry of its own
+
+
+class LoopbackHub(object):
+    """Connects nodes within the same process, without any sockets or serialization.
+
+    Keeps the semantics of the real `Hub`: messages to a node are delivered asynchronously and in the order they were
+    sent; messages to a node that isn't there (or stops before they're delivered), or that can't be copied, fail with
+    `send_failed`, and watchers of a node are told it's down once it stops, or right away if it doesn't exist.
+
+    Messages are handed to the `on_deliver(sender_nid, msg_h, copy)` of the receiving node, which is expected to deep
+    copy them unless `copy` is false; without `on_deliver`, they go through the codec and `on_receive` like with `Hub`.
+    Only turn copying off if the messages are never mutated, as the nodes will then share them, refs included.
+
+    """
+    implements(IHub)
+
+    def __init__(self, nid, is_relay=False, on_node_down=lambda ref, nid: ref << ('_node_down', nid),
+                 on_receive=None, on_deliver=None, copy=True, registry=None):
+        self.nid = nid
+        self.copy = copy
+        self._on_node_down = on_node_down
+        self._on_receive = on_receive
+        self._on_deliver = on_deliver
+        self._registry = _NODES if registry is None else registry
+        if self._registry.get(nid) is not None:
+            raise Exception("Failed to bind to %s: already in use" % (nid,))
+        self._registry[nid] = self
+        self._watched_nodes = {}
+        # like with `Hub`, everything goes through a single greenlet, which keeps the messages to each node in order
+        self._queue = deque()
+        self._wakeup = Event()
+        self._writer = spawn(self._write)
+
+    def send_message(self, nid, msg_h):
+        self._enqueue(self._send, nid, msg_h)
+
+    def watch_node(self, nid, watch_handle):
+        if nid not in self._watched_nodes:
+            self._watched_nodes[nid] = set([watch_handle])
+            if self._registry.get(nid) is None:
+                self._enqueue(self._node_down, nid)
+        else:
+            self._watched_nodes[nid].add(watch_handle)
+
+    def unwatch_node(self, nid, watch_handle):
+        try:
+            self._watched_nodes[nid].discard(watch_handle)
+        except KeyError:
+            pass
+
+    def stop(self):
+        self.stop = lambda: None
+        self.send_message = lambda nid, msg_h: None
+        self.watch_node = lambda nid, watch_handle: None
+        self.unwatch_node = lambda nid, watch_handle: None
+        if self._registry.get(self.nid) is self:
+            del self._registry[self.nid]
+        self._writer.kill()
+        self._drain()  # not to lose anything sent just before stopping
+        for hub in self._registry.values():
+            if self.nid in hub._watched_nodes:
+                hub._enqueue(hub._node_down, self.nid)
+
+    def _enqueue(self, fn, *args):
+        self._queue.append((fn, args))
+        self._wakeup.set()
+
+    def _write(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._drain()
+
+    def _drain(self):
+        queue = self._queue
+        while queue:
+            fn, args = queue.popleft()
+            fn(*args)
+
+    def _send(self, nid, msg_h):
+        hub = self._registry.get(nid)
+        if hub is None:
+            msg_h.send_failed()
+            return
+        try:
+            if hub._on_deliver:
+                hub._on_deliver(self.nid, msg_h, hub.copy)
+            else:
+                hub._on_receive(self.nid, msg_h.serialize())
+        except Exception as e:  # not to take down the writer, which would hold up everything sent after it
+            err("Failed to deliver %r: %s\n%s" % (msg_h, e, traceback.format_exc()))
+            msg_h.send_failed()
+
+    def _node_down(self, nid):
+        for watch_handle in self._watched_nodes.pop(nid, []):
+            self._on_node_down(watch_handle, nid)
+
+    def __repr__(self):
+        return "LoopbackHub(%s)" % (self.nid,)
+verifyClass(IHub, LoopbackHub)
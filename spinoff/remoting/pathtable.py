@@ -0,0 +1,33 @@
+import random
+
+
+__all__ = ['PathTable', 'NO_PATHS']
+
+
+NO_PATHS = 0  # the epoch sent with messages that don't use a table of paths
+MAX_EPOCH = 255
+
+
+class PathTable(dict):
+    """The paths sent to, or received from, a node over one connection, for the codec to refer to by their numeric IDs;
+    see `Codec.encode`.
+
+    Each time the sending table starts over, it moves on to a new epoch, which is sent along with every message that
+    uses the table; a receiving table starts over as soon as a message of another epoch arrives. That way, an ID never
+    resolves to the path it meant in an earlier epoch, even if the message that defined it anew got lost. Tables start
+    at a random epoch, so that a restarted node is unlikely to pick up where its previous incarnation left off.
+
+    """
+    __slots__ = ('epoch',)
+
+    def __init__(self):
+        dict.__init__(self)
+        self.epoch = random.randint(1, MAX_EPOCH)
+
+    def start_over(self, epoch=None):
+        """Forgets all paths, and moves on to the next epoch, or to `epoch`."""
+        self.clear()
+        self.epoch = self.epoch % MAX_EPOCH + 1 if epoch is None else epoch
+
+    def __repr__(self):
+        return "PathTable(epoch=%d, %s)" % (self.epoch, dict.__repr__(self))
@@ -1,37 +1,119 @@
 # coding: utf8
 from __future__ import print_function, absolute_import
 
-from pickle import Unpickler, BUILD
+import copy
+import sys
+from cPickle import Pickler, Unpickler, dumps as legacy_dumps
+from cStringIO import StringIO
+from functools import partial
 
-from spinoff.actor.ref import Ref
+from spinoff.actor.ref import Ref, REF_LOADER
+from spinoff.actor.uri import Uri
 
 
-class IncomingMessageUnpickler(Unpickler):
-    """Unpickler for attaching a `Hub` instance to all deserialized `Ref`s."""
+def dumps(obj, buffers=None, threshold=0):
+    """Pickles `obj` for sending to another node, with all `Ref`s in it written as just their URIs.
 
-    def __init__(self, node, file):
-        Unpickler.__init__(self, file)
-        self.node = node
+    If `buffers` is a list, the `buffer`s and `memoryview`s in `obj`, and its `bytearray`s of at least `threshold`
+    bytes, are appended to it and written as `OutOfBand` placeholders; otherwise, `buffer`s and `memoryview`s, which
+    can't be pickled, are written as `str`s.
 
-    # called by `Unpickler.load` before an uninitalized object is about to be filled with members;
-    def _load_build(self):
-        """See `pickle.py` in Python's source code."""
-        # if the ctor. function (penultimate on the stack) is the `Ref` class...
-        if isinstance(self.stack[-2], Ref):
-            # Ref.__setstate__ will know it's a remote ref if the state is a tuple
-            self.stack[-1] = (self.stack[-1], self.node)
+    """
+    f = StringIO()
+    pickler = Pickler(f, 2)
+    # unlike `persistent_id`, this is only consulted for objects that aren't of any of the builtin types, which `str`,
+    # `tuple` and the like are, but `Ref`s and all the binary types other than `str` aren't
+    pickler.inst_persistent_id = _persistent_id if buffers is None else partial(_persistent_id_oob, buffers, threshold)
+    pickler.dump(obj)
+    return f.getvalue()
 
-            self.load_build()  # continue with the default implementation
 
-            # detect our own refs sent back to us
-            ref = self.stack[-1]
-            if ref.uri.node == self.node.nid:
-                ref.is_local = True
-                ref._cell = self.node.guardian.lookup_cell(ref.uri)
-                # dbg(("dead " if not ref._cell else "") + "local ref detected")
-                del ref.node  # local refs never need access to the node
-        else:  # pragma: no cover
-            self.load_build()
+def loads(node, data, buffers=()):
+    """Unpickles what `dumps` pickled on another node, attaching all `Ref`s in it to `node`.
 
-    dispatch = dict(Unpickler.dispatch)  # make a copy of the original
-    dispatch[BUILD] = _load_build  # override the handler of the `BUILD` instruction
+    `buffers` are the `buffer`s of the out-of-band payloads that `OutOfBand` placeholders in the pickle refer to.
+
+    """
+    unpickler = Unpickler(StringIO(data))
+    unpickler.persistent_load = partial(_persistent_load, node, buffers)
+    unpickler.find_global = partial(_find_global, node)
+    return unpickler.load()
+
+
+def legacy_dumps_envelope(path, message, sender):
+    """Pickles the envelope of a message the way nodes did before there were codecs, with all `Ref`s in it written as
+    objects whose state is their URI; those nodes can't read anything else, and `loads` can read this too.
+
+    """
+    return legacy_dumps((path, message, sender), 2)
+
+
+def deepcopy(node, obj):
+    """Deep-copies `obj` as if `dumps` had sent it to `node` and `loads` had loaded it there, but without pickling it."""
+    return copy.deepcopy(obj, {REF_LOADER: partial(load_ref, node)})
+
+
+def load_ref(node, uri):
+    """Returns a `Ref` to the actor at `uri` that has been received by `node`."""
+    uri = Uri.parse(uri)
+    if uri.node == node.nid:  # our own refs sent back to us
+        return Ref(cell=node.guardian.lookup_cell(uri), uri=uri, node=None, is_local=True)
+    return Ref(cell=None, uri=uri, node=node, is_local=False)
+
+
+class OutOfBand(object):
+    """Stands in for a binary payload that is sent as a frame of its own, as the `index`-th of the buffers of a message."""
+    __slots__ = ('index', 'type')
+
+    def __init__(self, index, type):
+        self.index, self.type = index, type
+
+
+# how to turn the `buffer` of a received frame back into an object of the type that was sent
+_OOB_TYPES = [(str, lambda buf: buf[:]), (bytearray, bytearray), (buffer, lambda buf: buf), (memoryview, memoryview)]
+_OOB_TYPE_IDS = dict((t, i) for i, (t, _) in enumerate(_OOB_TYPES))
+
+
+def _persistent_id(obj):
+    t = type(obj)
+    if t is Ref:
+        return str(obj.uri)
+    elif t is OutOfBand:
+        return (_OOB_TYPE_IDS[obj.type], obj.index)
+    elif t is buffer:
+        return (_OOB_TYPE_IDS[str], obj[:])  # inline
+    elif t is memoryview:
+        return (_OOB_TYPE_IDS[str], obj.tobytes())
+    return None
+
+
+def _persistent_id_oob(buffers, threshold, obj):
+    t = type(obj)
+    if t is Ref:  # by far the most common, so without the extra call
+        return str(obj.uri)
+    elif t is buffer or t is memoryview or t is bytearray and len(obj) >= threshold:
+        buffers.append(obj)
+        return (_OOB_TYPE_IDS[t], len(buffers) - 1)
+    return _persistent_id(obj)
+
+
+def _find_global(node, module, name):
+    if module == 'spinoff.actor.ref' and name == 'Ref':
+        # a `Ref` pickled the legacy way: it's created empty and then given its URI by `__setstate__`
+        class _LegacyRef(Ref):
+            __slots__ = ()
+
+            def __setstate__(self, uri):
+                ref = load_ref(node, uri)
+                self.__class__ = Ref
+                self._cell, self.uri, self.node, self.is_local = ref._cell, ref.uri, ref.node, ref.is_local
+        return _LegacyRef
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+
+def _persistent_load(node, buffers, pid):
+    if type(pid) is str:
+        return load_ref(node, pid)
+    type_id, index = pid
+    return _OOB_TYPES[type_id][1](buffers[index] if type(index) is int else index)
@@ -0,0 +1,76 @@
+import socket
+import time
+
+from gevent.event import AsyncResult
+from gevent.pool import Group
+from gevent.socket import gethostbyname
+
+
+__all__ = ['Resolver']
+
+
+class Resolver(object):
+    """Resolves host names with `gethostbyname` and caches the results, so that connecting to a host that's already been
+    resolved never waits on DNS.
+
+    Addresses are cached for `ttl` seconds; after that, the cached address is still returned but it's resolved again in
+    the background, and replaced once that succeeds (or dropped if the name has ceased to exist). Failures to resolve are
+    cached for `negative_ttl` seconds, so that a burst of reconnects to a bad host name doesn't hit the DNS each time.
+    Concurrent lookups of the same name share one query.
+
+    """
+    def __init__(self, ttl=60.0, negative_ttl=5.0, resolve=gethostbyname, clock=time.time):
+        self.ttl, self.negative_ttl = ttl, negative_ttl
+        self._resolve, self._clock = resolve, clock
+        self._cache = {}  # host => (address or the exception raised, expires at)
+        self._pending = {}  # host => AsyncResult of the query in flight
+        self._refreshers = Group()
+        self.hits = self.misses = 0
+
+    def resolve(self, host):
+        """Returns the address of `host`, or raises the `socket.gaierror` it failed with."""
+        entry = self._cache.get(host)
+        if entry is not None:
+            result, expires_at = entry
+            if isinstance(result, Exception):
+                if self._clock() < expires_at:
+                    self.hits += 1
+                    raise result
+            else:
+                self.hits += 1
+                if self._clock() >= expires_at and host not in self._pending:
+                    self._refreshers.spawn(self._lookup, host)
+                return result
+        self.misses += 1
+        pending = self._pending.get(host)
+        return (pending if pending is not None else self._lookup(host)).get()
+
+    def forget(self, host):
+        self._cache.pop(host, None)
+
+    def stop(self):
+        self._refreshers.kill()
+
+    def _lookup(self, host):
+        self._pending[host] = pending = AsyncResult()
+        try:
+            address = self._resolve(host)
+        except socket.gaierror as e:
+            stale = self._cache.get(host)
+            if stale is not None and not isinstance(stale[0], Exception) and e.errno != socket.EAI_NONAME:
+                # keep using the last known address while the DNS is having trouble
+                self._cache[host] = (stale[0], self._clock() + self.negative_ttl)
+            else:
+                self._cache[host] = (e, self._clock() + self.negative_ttl)
+            pending.set_exception(e)
+        except Exception as e:
+            pending.set_exception(e)
+        else:
+            self._cache[host] = (address, self._clock() + self.ttl)
+            pending.set(address)
+        finally:
+            del self._pending[host]
+        return pending
+
+    def __repr__(self):
+        return "Resolver(ttl=%r, negative_ttl=%r)" % (self.ttl, self.negative_ttl)
@@ -3,17 +3,24 @@ from __future__ import print_function
 import gc
 import random
 import re
+import shutil
+import socket
+import tempfile
 import weakref
 
-from gevent import idle, sleep, GreenletExit, with_timeout, Timeout
+from gevent import getcurrent, idle, spawn, Greenlet, sleep, GreenletExit, with_timeout, Timeout
 from gevent.event import Event, AsyncResult
-from gevent.queue import Channel
+from gevent.queue import Channel, Empty
 from nose.tools import eq_, ok_
 
-from spinoff.actor import Actor, Props, Node, Uri
+from spinoff.actor import Actor, Props, Node, Uri, ask_all, ask_first, ask_quorum
 from spinoff.actor.ref import Ref
 from spinoff.actor.events import Events, UnhandledMessage, DeadLetter
-from spinoff.actor.exceptions import Unhandled, NameConflict, UnhandledTermination
+from spinoff.actor.dispatcher import Dispatcher
+from spinoff.remoting import hub
+from spinoff.remoting.codec import BinaryCodec
+from spinoff.actor.mailbox import DROP_NEWEST, DROP_OLDEST, DEAD_LETTER
+from spinoff.actor.exceptions import Unhandled, NameConflict, UnhandledTermination, NoQuorum
 from spinoff.util.pattern_matching import ANY, IS_INSTANCE
 from spinoff.util.testing import assert_raises, expect_one_warning, expect_one_event, expect_failure, MockActor, expect_event_not_emitted
 from spinoff.util.testing.actor import wrap_globals
@@ -168,6 +175,82 @@ def test_receive_of_the_same_actor_never_executes_concurrently(defer):
     receive_called.wait_eq(2)
 
 
+@deferred_cleanup
+def test_receive_is_dispatched_inline_until_it_blocks(defer):
+    # Receive runs directly in the actor's own greenlet until it blocks once; from then on it gets a greenlet per
+    # message so that system messages are still handled while it's blocked.
+    class MyActor(Actor):
+        def receive(self, message):
+            greenlets.append(getcurrent())
+            if message == 'block':
+                sleep(.001)
+
+    node = DummyNode()
+    defer(node.stop)
+    greenlets = []
+    a = node.spawn(MyActor)
+    a << 'foo' << 'bar'
+    wait(lambda: len(greenlets) == 2)
+    ok_(greenlets[0] is greenlets[1])
+    a << 'block' << 'baz' << 'baz'
+    wait(lambda: len(greenlets) == 5)
+    ok_(greenlets[2] is greenlets[0])
+    ok_(greenlets[3] is not greenlets[0])
+    ok_(greenlets[4] is not greenlets[3])
+
+
+@deferred_cleanup
+def test_throughput_determines_how_many_messages_are_received_before_yielding_to_other_greenlets(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            log.append(message)
+
+    for factory, batch_size in [(MyActor, 1), (Props(MyActor).with_throughput(3), 3)]:
+        node = DummyNode()
+        defer(node.stop)
+        log = []
+        a = node.spawn(factory)
+        for i in range(6):
+            a << i
+        # tick in between whatever else is being run until the actor has received all messages
+        while 5 not in log:
+            log.append('|')
+            sleep(0)
+        batches = ''.join('x' if x != '|' else x for x in log).split('|')
+        eq_(max(len(x) for x in batches), batch_size)
+
+
+@deferred_cleanup
+def test_actor_that_crashes_or_stops_in_the_middle_of_a_batch_receives_no_more_messages(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            log.append(message)
+            if message == 'boom':
+                raise MockException
+            elif message == 'stop':
+                self.stop()
+
+    def send_batch(first):
+        a = node.spawn(Props(MyActor).with_throughput(10))
+        a << first << 1 << 2 << 3
+        sleep(.01)
+
+    dead_letters = []
+    Events.subscribe(DeadLetter, dead_letters.append)
+    defer(lambda: Events.unsubscribe(DeadLetter, dead_letters.append))
+    for first in ['boom', 'stop']:
+        node = DummyNode()
+        defer(node.stop)
+        log, dead_letters[:] = [], []
+        if first == 'boom':
+            with expect_failure(MockException):
+                send_batch(first)
+        else:
+            send_batch(first)
+        eq_(log, [first])
+        eq_([x.message for x in dead_letters], [1, 2, 3])
+
+
 @deferred_cleanup
 def test_unhandled_message_is_reported(defer):
     # Unhandled messages are reported to Events
@@ -199,6 +282,129 @@ def test_with_no_receive_method_all_messages_are_unhandled(defer):
         a << 'dummy'
 
 
+@deferred_cleanup
+def test_ask_returns_the_reply_without_spawning_an_actor(defer):
+    class Echo(Actor):
+        def receive(self, message):
+            self.sender << message
+
+    class Asker(Actor):
+        def receive(self, message):
+            replies.set(self.ref.node.lookup_str('/echo').ask(message))
+
+    node = DummyNode()
+    defer(node.stop)
+    echo = node.spawn(Echo, name='echo')
+    eq_(echo.ask('foo'), 'foo')
+    replies = AsyncResult()
+    node.spawn(Asker) << 'bar'
+    eq_(replies.get(), 'bar')
+    eq_(len(node.guardian.children), 2)
+    eq_(sorted(node._cells), ['/asker$1', '/echo'])
+
+
+@deferred_cleanup
+def test_late_replies_to_an_ask_that_timed_out_are_deadlettered(defer):
+    class Procrastinator(Actor):
+        def receive(self, message):
+            senders.append(self.sender)
+
+    node = DummyNode()
+    defer(node.stop)
+    senders = []
+    a = node.spawn(Procrastinator)
+    with assert_raises(Timeout):
+        a.ask('foo', timeout=.01)
+    eq_(sorted(node._cells), [a.uri.path])
+    sender, = senders
+    with expect_one_event(DeadLetter(sender, 'too-late', sender=None)):
+        sender << 'too-late'
+
+
+@deferred_cleanup
+def test_asking_many_actors_at_once(defer):
+    class Replier(Actor):
+        def __init__(self, reply, delay):
+            self.reply, self.delay = reply, delay
+
+        def receive(self, message):
+            sleep(self.delay)
+            self.sender << self.reply
+
+    node = DummyNode()
+    defer(node.stop)
+    a, b, c = [node.spawn(Replier.using(reply, delay)) for reply, delay in [('a', .02), ('b', 0), ('x', .01)]]
+    eq_(ask_all([a, b, c], 'foo'), ['a', 'b', 'x'])
+    eq_(ask_all([], 'foo'), [])
+    eq_(ask_first([a, b, c], 'foo'), ['b'])
+    eq_(ask_first([a, b, c], 'foo', n=2), ['b', 'x'])
+    with assert_raises(Timeout):
+        ask_all([a, b, c], 'foo', timeout=.015)
+    sleep(.02)
+    eq_(sorted(node._cells), sorted(x.uri.path for x in [a, b, c]))
+
+
+@deferred_cleanup
+def test_asking_many_actors_for_a_quorum(defer):
+    class Replier(Actor):
+        def __init__(self, reply):
+            self.reply = reply
+
+        def receive(self, message):
+            self.sender << self.reply
+
+    node = DummyNode()
+    defer(node.stop)
+    yes, no, error = [node.spawn(Replier.using(x)) for x in ['yes', 'no', MockException()]]
+    eq_(ask_quorum([yes, no, yes], 'foo'), 'yes')
+    eq_(ask_quorum([no, yes, no, error, no], 'foo', n=3), 'no')
+    with assert_raises(NoQuorum):
+        ask_quorum([yes, no, error], 'foo')
+
+
+@deferred_cleanup
+def test_send_later_can_be_cancelled(defer):
+    class Scheduler(Actor):
+        def receive(self, message):
+            if message == 'go':
+                self.send_later(.01, 'first')
+                self.send_later(.02, 'cancelled').cancel()
+                self.send_later(.03, 'second')
+            else:
+                received.append(message)
+
+    node = DummyNode()
+    defer(node.stop)
+    received = []
+    node.spawn(Scheduler) << 'go'
+    sleep(.005)
+    eq_(received, [])
+    eq_(len(node.timers), 2)
+    sleep(.05)
+    eq_(received, ['first', 'second'])
+    eq_(len(node.timers), 0)
+
+
+@deferred_cleanup
+def test_get_with_a_timeout(defer):
+    class Getter(Actor):
+        def run(self):
+            with assert_raises(Empty):
+                self.get(timeout=.01)
+            with assert_raises(Empty):
+                self.get_nowait('foo')
+            got.set(self.get(timeout=1.0))
+
+    node = DummyNode()
+    defer(node.stop)
+    got = AsyncResult()
+    a = node.spawn(Getter)
+    sleep(.03)
+    a << 'foo'
+    eq_(got.get(), 'foo')
+    eq_(len(node.timers), 0)
+
+
 ##
 ## SPAWNING
 
@@ -386,6 +592,142 @@ def test_stopping_an_actor_prevents_it_from_processing_any_more_messages(defer):
         a << None
 
 
+@deferred_cleanup
+def test_stopping_a_flooded_actor_does_not_wait_for_the_queued_messages(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+            released.wait()
+
+    node = DummyNode()
+    defer(node.stop)
+    received, released, dead_letters = [], Event(), []
+    Events.subscribe(DeadLetter, dead_letters.append)
+    defer(lambda: Events.unsubscribe(DeadLetter, dead_letters.append))
+    a = node.spawn(MyActor)
+    a << 'first'
+    wait(lambda: received)
+    for i in range(1000):
+        a << i
+    a.stop()
+    released.set()
+    wait(lambda: len(dead_letters) == 1000)
+    eq_(received, ['first'])
+    eq_([x.message for x in dead_letters], range(1000))
+
+
+@deferred_cleanup
+def test_sending_to_a_full_mailbox_blocks_the_sender_until_there_is_room(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+            released.wait()
+
+    node = DummyNode()
+    defer(node.stop)
+    received, released, sent = [], Event(), []
+    a = node.spawn(Props(MyActor).with_mailbox(2))
+    a << 'first'
+    wait(lambda: received)
+
+    def sender():
+        for i in range(5):
+            a << i
+            sent.append(i)
+    defer(spawn(sender).kill)
+    wait(lambda: sent == [0, 1])
+    eq_(len(a._cell.mailbox), 2)
+    released.set()
+    wait(lambda: received == ['first', 0, 1, 2, 3, 4])
+    eq_(a._cell.mailbox.high_water, 2)
+
+
+@deferred_cleanup
+def test_full_mailbox_overflow_policies(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+            released.wait()
+
+    for overflow, expected_received, expected_dead in [
+        (DROP_NEWEST, ['first', 0, 1], []),
+        (DROP_OLDEST, ['first', 2, 3], []),
+        (DEAD_LETTER, ['first', 0, 1], [2, 3]),
+    ]:
+        node = DummyNode()
+        defer(node.stop)
+        received, released, dead_letters = [], Event(), []
+        Events.subscribe(DeadLetter, dead_letters.append)
+        defer(lambda dead_letters=dead_letters: Events.unsubscribe(DeadLetter, dead_letters.append))
+        a = node.spawn(Props(MyActor).with_mailbox(2, overflow))
+        a << 'first'
+        wait(lambda: received)
+        for i in range(4):
+            a << i
+        eq_(a._cell.mailbox.dropped, 2)
+        released.set()
+        wait(lambda: len(received) == 3)
+        sleep(.01)
+        eq_(received, expected_received)
+        eq_([x.message for x in dead_letters], expected_dead)
+
+
+def test_mailbox_capacity_must_be_a_positive_int():
+    class MyActor(Actor):
+        pass
+    for capacity in [0, -1, 1.5, None]:
+        with assert_raises(TypeError):
+            Props(MyActor).with_mailbox(capacity)
+
+
+@deferred_cleanup
+def test_pooled_actors_are_run_by_the_workers_of_the_dispatcher(defer):
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append((message, getcurrent()._cell))
+
+    received = []
+    for node, factory in [(Node(dispatcher=Dispatcher()), MyActor),
+                          (DummyNode(), Props(MyActor).with_dispatcher(Dispatcher()))]:
+        defer(node.stop)
+        a = node.spawn(factory)
+        ok_(not isinstance(a._cell, Greenlet))
+        a << 'foo'
+        wait(lambda: received)
+        eq_(received, [('foo', a._cell)])
+        del received[:]
+
+
+@deferred_cleanup
+def test_pooled_actor_that_blocks_does_not_hold_up_the_others(defer):
+    class Blocker(Actor):
+        def receive(self, message):
+            released.wait()
+            log.append('unblocked')
+
+    class MyActor(Actor):
+        def receive(self, message):
+            log.append(message)
+
+    node = Node(dispatcher=Dispatcher(size=1))
+    defer(node.stop)
+    released, log = Event(), []
+    node.spawn(Blocker) << 'block'
+    for i in range(3):
+        node.spawn(MyActor) << i
+    wait(lambda: len(log) == 3)
+    released.set()
+    wait(lambda: len(log) == 4)
+    eq_(log, [0, 1, 2, 'unblocked'])
+    wait(lambda: node.dispatcher._running == 1)
+
+
+def test_dispatcher_size_must_be_a_positive_int():
+    for size in [0, -1, 1.5, None]:
+        with assert_raises(TypeError):
+            Dispatcher(size)
+
+
 @deferred_cleanup
 def test_stopping_calls_post_stop(defer):
     class MyActor(Actor):
@@ -764,6 +1106,15 @@ def test_uri_hash():
     eq_(hash(Uri.parse('localhost:123/foo')), hash(Uri.parse('localhost:123/foo')))
 
 
+def test_equal_uris_are_the_same_object_and_immutable():
+    uri = Uri.parse('localhost:123/foo/bar')
+    ok_(uri is Uri.parse('localhost:123/foo/bar'))
+    ok_(uri is Uri.parse('localhost:123') / 'foo' / 'bar')
+    ok_(uri.parent is Uri.parse('localhost:123/foo'))
+    with assert_raises(AttributeError):
+        uri.name = 'baz'
+
+
 ## LOOKUP
 
 @deferred_cleanup
@@ -824,6 +1175,19 @@ def test_looking_up_a_non_existent_local_actor_raises_runtime_error(defer):
         node.guardian / 'noexist'
 
 
+@deferred_cleanup
+def test_looking_up_a_stopped_actor_fails_and_it_is_forgotten(defer):
+    node = DummyNode()
+    defer(node.stop)
+    a = node.spawn(Actor, name='a')
+    a._cell.spawn_actor(Actor, name='b')
+    a.stop()
+    wait(lambda: a.is_stopped)
+    with assert_raises(RuntimeError):
+        node.lookup_str('/a/b')
+    wait(lambda: not node._cells)
+
+
 # def test_looking_up_a_non_existent_local_actor_returns_a_dead_ref_with_nevertheless_correct_uri():
 #     network = MockNetwork(Clock())
 #     node = network.node('local:123')
@@ -1415,6 +1779,334 @@ def test_messages_sent_to_nonexistent_remote_actors_are_deadlettered(defer):
 test_messages_sent_to_nonexistent_remote_actors_are_deadlettered.timeout = 3.0
 
 
+@deferred_cleanup
+def test_asking_a_remote_actor(defer):
+    class Echo(Actor):
+        def receive(self, message):
+            self.sender << message
+
+    node1, node2 = Node('localhost:20001', enable_remoting=True), Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    node2.spawn(Echo, name='echo')
+    eq_(node1.lookup_str('localhost:20002/echo').ask('foo'), 'foo')
+test_asking_a_remote_actor.timeout = 3.0
+
+
+@deferred_cleanup
+def test_asking_many_remote_actors_at_once(defer):
+    class Echo(Actor):
+        def receive(self, message):
+            self.sender << (self.ref, message)
+
+    node1, node2 = Node('localhost:20001', enable_remoting=True), Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    for name in ['a', 'b']:
+        node2.spawn(Echo, name=name)
+    refs = [node1.lookup_str('localhost:20002/a'), node1.lookup_str('localhost:20002/b')]
+    eq_(ask_all(refs, 'foo'), [(refs[0], 'foo'), (refs[1], 'foo')])
+test_asking_many_remote_actors_at_once.timeout = 3.0
+
+
+@deferred_cleanup
+def test_batched_remote_messages_arrive_in_order(defer):
+    node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'batching': True, 'max_batch_size': 64})
+    node2 = Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    collector << 'first'
+    received.wait_eq(['first'])
+    for i in range(500):
+        collector << ('msg', i)
+    received.wait_eq(['first'] + [('msg', i) for i in range(500)])
+test_batched_remote_messages_arrive_in_order.timeout = 3.0
+
+
+@deferred_cleanup
+def test_sending_large_binary_payloads_to_remote_actors(defer):
+    node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'batching': True}, codec=BinaryCodec())
+    node2 = Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    blob = 'x' * 1000000
+    collector << 'before' << ('blob', blob, bytearray(blob)) << 'after'
+    received.wait_eq(['before', ('blob', blob, bytearray(blob)), 'after'])
+test_sending_large_binary_payloads_to_remote_actors.timeout = 3.0
+
+
+@deferred_cleanup
+def test_remote_messages_still_arrive_after_the_receiver_loses_its_paths(defer):
+    node1, node2 = Node('localhost:20001', enable_remoting=True, codec=BinaryCodec()), Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    collector << 'first'
+    received.wait_eq(['first'])
+    node2._hub._paths_in.clear()  # as if the message that came with the path had been lost
+    collector << 'lost'
+    sleep(.05)
+    collector << 'second'
+    received.wait_eq(['first', 'second'])
+test_remote_messages_still_arrive_after_the_receiver_loses_its_paths.timeout = 3.0
+
+
+@deferred_cleanup
+def test_large_remote_messages_can_be_compressed(defer):
+    node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'compression_threshold': 1000})
+    node2 = Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    collector << 'first'  # only compressed once the receiver has told it can decompress
+    received.wait_eq(['first'])
+    big = ('big', ['abc' * 1000, 'def' * 1000])
+    collector << big << 'small'
+    received.wait_eq(['first', big, 'small'])
+    stats = node1._hub.stats
+    eq_((stats.messages_compressed, node2._hub.stats.messages_decompressed), (1, 1))
+    ok_(stats.compression_ratio > 10 and stats.compression_time > 0)
+test_large_remote_messages_can_be_compressed.timeout = 3.0
+
+
+@deferred_cleanup
+def test_remote_messages_are_not_compressed_for_nodes_that_cant_decompress(defer):
+    node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'compression_threshold': 1000})
+    node2 = Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    node2._hub._capabilities = ''  # as pinged by older nodes
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    collector << 'first'
+    received.wait_eq(['first'])
+    big = 'abc' * 1000
+    collector << big
+    received.wait_eq(['first', big])
+    eq_(node1._hub.stats.messages_compressed, 0)
+test_remote_messages_are_not_compressed_for_nodes_that_cant_decompress.timeout = 3.0
+
+
+@deferred_cleanup
+def test_remote_messages_of_any_version_arrive_with_or_without_compression(defer):
+    for compression_threshold in [None, 1000]:
+        node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'compression_threshold': compression_threshold})
+        node2 = Node('localhost:20002', enable_remoting=True)
+        defer(node1.stop, node2.stop)
+        received = obs_list()
+        node2.spawn(Props(MockActor, received), name='collector')
+        collector = node1.lookup_str('localhost:20002/collector')
+        collector << 'first'
+        received.wait_eq(['first'])
+        node1._hub._logic.version = 0x40000000 - 5  # where a flag set next to the version used to be
+        big = 'abc' * 1000
+        expected = ['first']
+        for i in range(10):
+            collector << i << big
+            expected += [i, big]
+        received.wait_eq(expected)
+        eq_(node1._hub.stats.messages_compressed, 10 if compression_threshold else 0)
+        node1.stop()
+        node2.stop()
+test_remote_messages_of_any_version_arrive_with_or_without_compression.timeout = 3.0
+
+
+@deferred_cleanup
+def test_remote_messages_that_cant_be_serialized_are_dead_lettered_without_holding_up_the_rest(defer):
+    node1 = Node('localhost:20001', enable_remoting=True)
+    node2 = Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    collector << 'first'
+    received.wait_eq(['first'])
+    with expect_one_event(DeadLetter, timeout=1.0):
+        collector << (lambda: None)
+    collector << 'second'
+    received.wait_eq(['first', 'second'])
+test_remote_messages_that_cant_be_serialized_are_dead_lettered_without_holding_up_the_rest.timeout = 3.0
+
+
+@deferred_cleanup
+def test_connecting_to_a_new_node_doesnt_hold_up_sending_to_others(defer):
+    resolve = hub.naddr_to_zmq_endpoint
+
+    def slow_resolve(naddr, *args, **kwargs):
+        if naddr.startswith('slowhost:'):
+            sleep(1.0)
+        return resolve(naddr, *args, **kwargs)
+    hub.naddr_to_zmq_endpoint = slow_resolve
+    defer(lambda: setattr(hub, 'naddr_to_zmq_endpoint', resolve))
+    node1, node2 = Node('localhost:20001', enable_remoting=True), Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    collector << 'first'
+    received.wait_eq(['first'])
+
+    def send_to_both():
+        node1.lookup_str('slowhost:20003/whatever') << 'foo'
+        collector << 'second'
+        received.wait_eq(['first', 'second'])
+    with_timeout(0.5, send_to_both)
+test_connecting_to_a_new_node_doesnt_hold_up_sending_to_others.timeout = 3.0
+
+
+@deferred_cleanup
+def test_a_node_that_fails_to_be_connected_to_is_connected_to_anew_once_it_is_told_down(defer):
+    node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'heartbeat_interval': 0.05, 'heartbeat_max_silence': 0.2})
+    node2 = Node('localhost:20002', enable_remoting=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='collector')
+    collector = node1.lookup_str('localhost:20002/collector')
+    resolve = hub.naddr_to_zmq_endpoint
+    hub.naddr_to_zmq_endpoint = lambda naddr, *args, **kwargs: 'bogus://' + naddr  # which ZeroMQ refuses to connect to
+    defer(lambda: setattr(hub, 'naddr_to_zmq_endpoint', resolve))
+    with expect_one_event(DeadLetter(collector, 'lost', sender=None), timeout=1.0):
+        collector << 'lost'
+        sleep(0.05)
+        ok_(not node1._hub._connecting)
+        hub.naddr_to_zmq_endpoint = resolve
+    collector << 'second'
+    received.wait_eq(['second'])
+test_a_node_that_fails_to_be_connected_to_is_connected_to_anew_once_it_is_told_down.timeout = 3.0
+
+
+@deferred_cleanup
+def test_messages_to_a_node_being_connected_to_beyond_the_queue_limit_become_dead_letters(defer):
+    node = Node('localhost:20001', enable_remoting=True, hub_kwargs={'max_queue_size': 2})
+    defer(node.stop)
+    ref = node.lookup_str('localhost:23456/actor2')
+    ref << 'foo' << 'bar'
+    with expect_one_event(DeadLetter(ref, 'baz', sender=None)):
+        ref << 'baz'
+    eq_(node._hub.queue_depths(), {'localhost:23456': (2, None)})
+test_messages_to_a_node_being_connected_to_beyond_the_queue_limit_become_dead_letters.timeout = 3.0
+
+
+@deferred_cleanup
+def test_nodes_on_the_same_host_talk_over_ipc_if_both_can(defer):
+    ipc_dir = tempfile.mkdtemp()
+    defer(lambda: shutil.rmtree(ipc_dir))
+    node1 = Node('localhost:20001', enable_remoting=True, hub_kwargs={'ipc_dir': ipc_dir})
+    node2 = Node('localhost:20002', enable_remoting=True, hub_kwargs={'ipc_dir': ipc_dir})
+    node3 = Node('localhost:20003', enable_remoting=True)
+    defer(node1.stop, node2.stop, node3.stop)
+    received = obs_list()
+    node1.spawn(Props(MockActor, received), name='collector')
+    node2.lookup_str('localhost:20001/collector') << 'over ipc'
+    received.wait_eq(['over ipc'])
+    node3.lookup_str('localhost:20001/collector') << 'over tcp'
+    received.wait_eq(['over ipc', 'over tcp'])
+    ok_(node2._hub._endpoints['localhost:20001'].startswith('ipc://'))
+    ok_(node3._hub._endpoints['localhost:20001'].startswith('tcp://'))
+test_nodes_on_the_same_host_talk_over_ipc_if_both_can.timeout = 3.0
+
+
+@deferred_cleanup
+def test_nodes_on_the_same_host_talk_over_tcp_if_the_ipc_socket_is_left_over_from_a_crash(defer):
+    ipc_dir = tempfile.mkdtemp()
+    defer(lambda: shutil.rmtree(ipc_dir))
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(hub.ipc_path(ipc_dir, 'localhost:20001'))
+    stale.close()  # without removing the file, as a node that crashes does
+    node1 = Node('localhost:20001', enable_remoting=True)
+    node2 = Node('localhost:20002', enable_remoting=True, hub_kwargs={'ipc_dir': ipc_dir})
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node1.spawn(Props(MockActor, received), name='collector')
+    node2.lookup_str('localhost:20001/collector') << 'over tcp'
+    received.wait_eq(['over tcp'])
+    ok_(node2._hub._endpoints['localhost:20001'].startswith('tcp://'))
+test_nodes_on_the_same_host_talk_over_tcp_if_the_ipc_socket_is_left_over_from_a_crash.timeout = 3.0
+
+
+def test_nodes_at_the_same_port_on_different_addresses_have_ipc_sockets_of_their_own():
+    ok_(hub.ipc_path('/tmp', '127.0.0.1:20001') != hub.ipc_path('/tmp', '127.0.0.2:20001'))
+
+
+@deferred_cleanup
+def test_loopback_nodes_send_each_other_copies_of_messages_and_refs(defer):
+    node1, node2 = Node('loop:1', enable_remoting=True, loopback=True), Node('loop:2', enable_remoting=True, loopback=True)
+    defer(node1.stop, node2.stop)
+    received1, received2 = obs_list(), obs_list()
+    actor1 = node1.spawn(Props(MockActor, received1), name='actor1')
+    node2.spawn(Props(MockActor, received2), name='actor2')
+    msg = ['mutable', actor1]
+    node1.lookup_str('loop:2/actor2') << msg
+    received2.wait_eq([msg])
+    copy = received2[0]
+    ok_(copy is not msg and copy[1] is not actor1 and not copy[1].is_local)
+    copy[1] << 'back'
+    received1.wait_eq(['back'])
+test_loopback_nodes_send_each_other_copies_of_messages_and_refs.timeout = 3.0
+
+
+@deferred_cleanup
+def test_loopback_nodes_can_share_messages_without_copying(defer):
+    node1 = Node('loop:1', enable_remoting=True, loopback=True, hub_kwargs={'copy': False})
+    node2 = Node('loop:2', enable_remoting=True, loopback=True, hub_kwargs={'copy': False})
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='actor2')
+    msg = ('shared', [1, 2])
+    node1.lookup_str('loop:2/actor2') << msg
+    received.wait_eq([msg])
+    ok_(received[0] is msg)
+test_loopback_nodes_can_share_messages_without_copying.timeout = 3.0
+
+
+@deferred_cleanup
+def test_loopback_messages_to_nonexistent_nodes_become_dead_letters(defer):
+    node = Node('loop:1', enable_remoting=True, loopback=True)
+    defer(node.stop)
+    ref = node.lookup_str('loop:2/actor2')
+    with expect_one_event(DeadLetter(ref, 'foo', sender=None)):
+        ref << 'foo'
+test_loopback_messages_to_nonexistent_nodes_become_dead_letters.timeout = 3.0
+
+
+@deferred_cleanup
+def test_loopback_messages_that_cant_be_copied_are_dead_lettered_without_holding_up_the_rest(defer):
+    node1, node2 = Node('loop:1', enable_remoting=True, loopback=True), Node('loop:2', enable_remoting=True, loopback=True)
+    defer(node1.stop, node2.stop)
+    received = obs_list()
+    node2.spawn(Props(MockActor, received), name='actor2')
+    ref = node1.lookup_str('loop:2/actor2')
+    with expect_one_event(DeadLetter, timeout=1.0):
+        ref << (x for x in [])  # generators can't be copied
+    ref << 'second'
+    received.wait_eq(['second'])
+test_loopback_messages_that_cant_be_copied_are_dead_lettered_without_holding_up_the_rest.timeout = 3.0
+
+
+@deferred_cleanup
+def test_watching_an_actor_on_a_loopback_node_that_stops(defer):
+    class Watcher(Actor):
+        def pre_start(self):
+            self.watch(self.root.node.lookup_str('loop:2/watchee'))
+
+        def receive(self, msg):
+            received.set(msg)
+
+    received = AsyncResult()
+    node1, node2 = Node('loop:1', enable_remoting=True, loopback=True), Node('loop:2', enable_remoting=True, loopback=True)
+    defer(node1.stop, node2.stop)
+    node2.spawn(Actor, name='watchee')
+    node1.spawn(Watcher)
+    sleep(.01)
+    node2.stop()
+    eq_(received.get(), ('terminated', node1.lookup_str('loop:2/watchee')))
+test_watching_an_actor_on_a_loopback_node_that_stops.timeout = 3.0
+
+
 ## HEARTBEAT
 
 @deferred_cleanup
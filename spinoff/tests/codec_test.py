@@ -0,0 +1,144 @@
+import pickle
+
+from nose.tools import eq_, ok_
+
+from spinoff.actor import Actor, Node
+from spinoff.actor.ref import Ref
+from spinoff.remoting.codec import BinaryCodec, PickleCodec, LegacyPickleCodec, PathTable, UnknownPath
+from spinoff.util.testing import assert_raises
+from spinoff.util.testing.actor import wrap_globals
+from spinoff.util.python import deferred_cleanup
+
+
+MESSAGES = [
+    'foo',
+    ('foo', 1, -2 ** 40, 1.5, None, True, False, u'\xe9', ''),
+    ('nested', ('tuple', (1,)), ()),
+    ('not', 'binary', [1, 2], {'a': 1}, set([3]), 2 ** 70),
+    ('small', bytearray('not a str')),
+]
+
+
+@deferred_cleanup
+def test_all_codecs_decode_what_any_of_them_encodes(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    for encoder in [BinaryCodec(), PickleCodec(), LegacyPickleCodec()]:
+        for decoder in [BinaryCodec(), PickleCodec(), LegacyPickleCodec()]:
+            for message in MESSAGES:
+                data = encoder.encode('/foo/bar', message, None)
+                eq_(decoder.decode(node, data), ('/foo/bar', message, None))
+                eq_(decoder.decode(node, buffer('header' + data, 6)), ('/foo/bar', message, None))
+
+
+@deferred_cleanup
+def test_refs_are_attached_to_the_receiving_node(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    local = node.spawn(Actor, name='local')
+    remote = node.lookup_str('other:1/remote')
+    for codec in [BinaryCodec(), PickleCodec(), LegacyPickleCodec()]:
+        path, (a, b), sender = codec.decode(node, codec.encode('/foo', (local, remote), remote))
+        ok_(a.is_local and a._cell is local._cell and a.node is None)
+        ok_(not b.is_local and b.node is node and b.uri == remote.uri)
+        ok_(not sender.is_local and sender.node is node)
+        ok_(type(a) is Ref and type(b) is Ref)
+
+
+@deferred_cleanup
+def test_legacy_pickle_codec_encodes_in_the_format_of_nodes_from_before_codecs(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    remote = node.lookup_str('other:1/remote')
+    data = LegacyPickleCodec().encode('/foo', ('foo', remote), remote)
+    # those nodes unpickle envelopes with a plain `Unpickler`, which can't load persistent IDs, and attach the refs in
+    # them to themselves as they're built
+    ok_('spinoff.actor.ref\nRef' in data)
+    eq_(pickle.loads(data), ('/foo', ('foo', remote), remote))
+
+
+@deferred_cleanup
+def test_large_binary_payloads_are_sent_out_of_band(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    codec = BinaryCodec(oob_threshold=100)
+    big = 'x' * 100
+    message = ('data', big, (bytearray(big), 'small'), memoryview(big), buffer('tiny'))
+    buffers = []
+    data = codec.encode('/foo', message, None, buffers)
+    eq_(buffers, [big, bytearray(big), memoryview(big), buffer('tiny')])
+    ok_(len(data) < 100)
+    _, decoded, _ = codec.decode(node, data, [buffer(bytearray(x)) for x in buffers])  # as if received as frames
+    eq_(decoded[:3], message[:3])
+    ok_(type(decoded[3]) is memoryview and decoded[3].tobytes() == big)
+    ok_(type(decoded[4]) is buffer and decoded[4][:] == 'tiny')
+    # without room for buffers, everything is sent inline
+    _, decoded, _ = codec.decode(node, codec.encode('/foo', message, None))
+    eq_(decoded, message[:3] + (big, 'tiny'))
+
+
+@deferred_cleanup
+def test_binary_payloads_other_than_strs_are_sent_out_of_band_from_anywhere_in_a_message(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    big = bytearray('x' * 100)
+    message = ['list', {'dict': big}, buffer('tiny')]
+    buffers = []
+    data = BinaryCodec(oob_threshold=100).encode('/foo', message, None, buffers)
+    eq_(buffers, [big, buffer('tiny')])
+    eq_(BinaryCodec().decode(node, data, [buffer(x) for x in buffers])[1], message)
+    # `PickleCodec` sends `buffer`s and `memoryview`s, which can't be pickled, as `str`s
+    _, decoded, _ = PickleCodec().decode(node, PickleCodec().encode('/foo', (buffer('ab'), memoryview('cd')), None))
+    eq_(decoded, ('ab', 'cd'))
+
+
+@deferred_cleanup
+def test_paths_are_sent_only_once_per_table(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    codec = BinaryCodec()
+    sender = node.lookup_str('other:1/some/deep/path/to/the/sender')
+    paths_out, paths_in = PathTable(), PathTable()
+    first, second = [codec.encode('/some/deep/path/to/the/recipient', 'foo', sender, paths=paths_out) for _ in range(2)]
+    ok_(len(second) < len(first) - 60)
+    eq_(codec.decode(node, first, paths=paths_in), ('/some/deep/path/to/the/recipient', 'foo', sender))
+    eq_(codec.decode(node, second, paths=paths_in), ('/some/deep/path/to/the/recipient', 'foo', sender))
+    # e.g. after a restart of the receiving node
+    with assert_raises(UnknownPath):
+        codec.decode(node, second, paths=PathTable())
+    # paths aren't compressed without a table on both ends
+    eq_(codec.decode(node, codec.encode('/foo', 'foo', sender)), ('/foo', 'foo', sender))
+
+
+@deferred_cleanup
+def test_ids_of_paths_from_an_earlier_epoch_never_resolve(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    codec = BinaryCodec()
+    paths_out, paths_in = PathTable(), PathTable()
+    eq_(codec.decode(node, codec.encode('/a', 'for-a', None, paths=paths_out), paths=paths_in), ('/a', 'for-a', None))
+
+    def run_out_of_ids():
+        for i in range(2 ** 14):
+            codec.encode('/%d' % i, 'x', None, paths=paths_out)
+    for start_over in [paths_out.start_over, run_out_of_ids]:
+        start_over()
+        codec.encode('/b', 'lost', None, paths=paths_out)  # gives /b the ID that /a had, but never arrives
+        with assert_raises(UnknownPath):
+            codec.decode(node, codec.encode('/b', 'secret-for-b', None, paths=paths_out), paths=paths_in)
+        paths_out.start_over()
+        eq_(codec.decode(node, codec.encode('/b', 'for-b', None, paths=paths_out), paths=paths_in), ('/b', 'for-b', None))
+        eq_(codec.decode(node, codec.encode('/b', 'for-b', None, paths=paths_out), paths=paths_in), ('/b', 'for-b', None))
+
+
+@deferred_cleanup
+def test_malformed_input_raises(defer):
+    node = Node('me:1')
+    defer(node.stop)
+    data = BinaryCodec().encode('/foo', ('foo', 'bar'), None)
+    for garbage in [data[:-1], data[:8], '\x01?']:
+        with assert_raises(Exception):
+            BinaryCodec().decode(node, garbage)
+
+
+wrap_globals(globals())
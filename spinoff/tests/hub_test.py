@@ -1,5 +1,8 @@
 import uuid
 import random
+import socket
+
+from gevent import sleep, spawn
 
 from nose.tools import ok_
 
@@ -7,7 +10,10 @@ from spinoff.util.testing.actor import wrap_globals
 from spinoff.remoting.hublogic import (
     HubLogic, Connect, Disconnect, NodeDown, Ping, Send, Receive, SendFailed, SigDisconnect,
     RelayConnect, RelaySend, RelaySigNodeDown, RelaySigConnected, RelayForward, RelaySigNew, RelayNvm,
-    NextBeat, IN, OUT, flatten, nid2addr)
+    NextBeat, SigResetPaths, IN, OUT, DROP_NEWEST, DROP_OLDEST, DEAD_LETTER, flatten, nid2addr)
+from spinoff.remoting.failuredetector import PhiAccrualFailureDetector
+from spinoff.remoting.resolver import Resolver
+from spinoff.util.testing import assert_raises
 from spinoff.util.pattern_matching import ANY
 
 
@@ -80,6 +86,12 @@ def test_sig_disconnect_while_still_connecting(t=Time, logic=DEFAULT_LOGIC, nid=
     emits_(logic.sig_disconnect_received(nid), [(Disconnect, nid2addr(nid)), (NodeDown, nid)])
 
 
+def test_path_unknown(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
+    t, logic = test_successful_connect(t, logic)
+    emits_(logic.path_unknown(nid), [(SigResetPaths, OUT, nid)])
+    emits_(logic.path_unknown('unknown:123'), [])
+
+
 #
 
 def test_sending_heartbeat(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
@@ -104,6 +116,97 @@ def test_fail_after_successful_connection(t=Time, logic=DEFAULT_LOGIC, nid=NID('
     emits_(logic.heartbeat(t=t.advance(logic.heartbeat_max_silence)), [(NextBeat, 1.0), (Disconnect, nid2addr(nid)), (NodeDown, nid)])
 
 
+def test_heartbeats_with_jitter_only_ping_the_nodes_that_are_due(t=Time):
+    t, logic = t(), HubLogic('me:123', 1.0, 3.0, heartbeat_jitter=0.5)
+    nids = ['node%d:123' % i for i in range(100)]
+    for nid in nids:
+        just_(logic.ping_received(IN, nid, 1, t.current))
+    pinged, time_to_next = [], 0.0
+    while t.advance(time_to_next) < 1.6:
+        actions = list(flatten(logic.heartbeat(t.current)))
+        (_, time_to_next), = [x for x in actions if x[0] is NextBeat]
+        ok_(0.1 <= time_to_next <= 1.0)
+        pinged.append(sorted(x[2] for x in actions if x[0] is Ping))
+    ok_(len(pinged) > 3 and max(len(x) for x in pinged) < 50)
+    ok_(set(sum(pinged, [])) == set(nids))
+
+
+def test_heartbeats_with_jitter_still_notice_silent_nodes(t=Time, nid=NID('kaamel:123')):
+    t, logic = t(), HubLogic('me:123', 1.0, 3.0, heartbeat_jitter=0.5)
+    just_(logic.ping_received(IN, nid, 1, t.current))
+    time_to_next = 0.0
+    while t.advance(time_to_next) < 3.0:
+        actions = list(flatten(logic.heartbeat(t.current)))
+        ok_((NodeDown, nid) not in actions)
+        (_, time_to_next), = [x for x in actions if x[0] is NextBeat]
+    ok_(t.current <= 3.1)
+    emits_(logic.heartbeat(t.current), [(Disconnect, nid2addr(nid)), (NodeDown, nid), (NextBeat, 1.0)])
+
+
+def test_failure_detector_notices_silence_sooner_after_regular_pings(t=Time, nid=NID('kaamel:123')):
+    t, logic = t(), HubLogic('me:123', 1.0, 3.0, failure_detector=PhiAccrualFailureDetector(8.0))
+    for version in range(20):
+        just_(logic.ping_received(IN, nid, version, t.advance(1.0)))
+    emits_not_(logic.heartbeat(t.advance(1.0)), [(NodeDown, nid)])
+    emits_(logic.heartbeat(t.advance(1.0)), [(Disconnect, nid2addr(nid)), (NodeDown, nid), (NextBeat, 1.0)])
+
+
+def test_failure_detector_tolerates_silence_after_irregular_pings(t=Time, nid=NID('kaamel:123')):
+    t, logic = t(), HubLogic('me:123', 1.0, 3.0, failure_detector=PhiAccrualFailureDetector(8.0))
+    for version in range(20):
+        just_(logic.ping_received(IN, nid, version, t.advance(0.2 if version % 2 else 3.0)))
+    emits_not_(logic.heartbeat(t.advance(4.0)), [(NodeDown, nid)])
+    emits_(logic.heartbeat(t.advance(6.0)), [(Disconnect, nid2addr(nid)), (NodeDown, nid), (NextBeat, 1.0)])
+
+
+def test_failure_detector_phi_grows_with_silence():
+    detector = PhiAccrualFailureDetector(8.0)
+    ok_('foo' not in detector)
+    for t in range(10):
+        detector.heartbeat('foo', float(t))
+    phis = [detector.phi('foo', 9.0 + x) for x in (0.5, 1.0, 1.5, 2.0)]
+    ok_(phis == sorted(phis) and phis[0] < 1.0 < 8.0 < phis[-1])
+    ok_(detector.is_available('foo', 10.0) and not detector.is_available('foo', 11.0))
+    ok_(abs(detector.phi('foo', detector.time_of_failure('foo')) - 8.0) < 1e-6)
+    detector.remove('foo')
+    ok_('foo' not in detector)
+
+
+def test_resolver_caches_addresses_and_refreshes_them_in_the_background(t=Time):
+    t, queries, addresses = t(), [], {'foo': '1.2.3.4'}
+
+    def resolve(host):
+        queries.append(host)
+        sleep(0.01)
+        return addresses[host]
+    resolver = Resolver(ttl=10.0, resolve=resolve, clock=lambda: t.current)
+    lookups = [spawn(resolver.resolve, 'foo') for _ in range(3)]
+    ok_([x.get() for x in lookups] == ['1.2.3.4'] * 3 and queries == ['foo'])
+    t.advance(11.0)
+    addresses['foo'] = '4.3.2.1'
+    ok_(resolver.resolve('foo') == '1.2.3.4')  # without waiting for the refresh
+    sleep(0.02)
+    ok_(resolver.resolve('foo') == '4.3.2.1' and queries == ['foo', 'foo'])
+    resolver.stop()
+
+
+def test_resolver_caches_failures_for_a_while(t=Time):
+    t, queries = t(), []
+
+    def resolve(host):
+        queries.append(host)
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    resolver = Resolver(negative_ttl=5.0, resolve=resolve, clock=lambda: t.current)
+    for _ in range(3):
+        with assert_raises(socket.gaierror):
+            resolver.resolve('nosuchhost')
+    ok_(queries == ['nosuchhost'])
+    t.advance(5.0)
+    with assert_raises(socket.gaierror):
+        resolver.resolve('nosuchhost')
+    ok_(queries == ['nosuchhost'] * 2)
+
+
 def test_failed_connect_and_then_successful_connect(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
     t, logic = test_failed_connect(t, logic, nid=nid)
     t, logic = test_successful_connect(lambda: t, lambda: logic, nid=nid)
@@ -133,6 +236,38 @@ def test_send_message_with_no_previous_connection_and_sigdisconnect_response(t=T
     emits_(logic.sig_disconnect_received(nid), [(Disconnect, nid2addr(nid)), (NodeDown, nid), (SendFailed, msg)])
 
 
+def test_messages_beyond_a_full_queue_fail_while_connecting(t=Time, nid=NID('kaamel:123')):
+    t, logic = t(), HubLogic('me:123', 1.0, 3.0, max_queue_size=2, queue_overflow=DEAD_LETTER)
+    emits_(logic.send_message(nid, 'msg1', t=t.current), [(Connect, nid2addr(nid)), (Ping, OUT, nid, ANY)])
+    emits_(logic.send_message(nid, 'msg2', t=t.current), [])
+    emits_(logic.send_message(nid, 'msg3', t=t.current), [(SendFailed, 'msg3')])
+    ok_(logic.queue_depth(nid) == (2, None) and logic.queue_overflows == 1)
+    emits_(logic.ping_received(OUT, nid, 0, t=t.current), [(Send, OUT, nid, ANY, 'msg1'), (Send, OUT, nid, ANY, 'msg2')])
+    ok_(logic.queue_depth(nid) == (0, None))
+
+
+def test_messages_beyond_a_full_queue_can_be_dropped_while_connecting(t=Time, nid=NID('kaamel:123')):
+    t = t()
+    for policy, expected in [(DROP_NEWEST, ['msg1', 'msg2']), (DROP_OLDEST, ['msg2', 'msg3'])]:
+        logic = HubLogic('me:123', 1.0, 3.0, max_queue_size=2, queue_overflow=policy)
+        for msg in ['msg1', 'msg2', 'msg3']:
+            emits_not_(logic.send_message(nid, msg, t=t.current), [(SendFailed, msg)])
+        emits_(logic.ping_received(OUT, nid, 0, t=t.current), [(Send, OUT, nid, ANY, msg) for msg in expected])
+
+
+def test_queue_of_messages_while_connecting_can_be_bounded_by_size(t=Time, nid=NID('kaamel:123')):
+    t, logic = t(), HubLogic('me:123', 1.0, 3.0, max_queue_bytes=10, queue_overflow=DROP_OLDEST, size_of=len)
+    just_(logic.send_message(nid, 'aaaa', t=t.current))
+    just_(logic.send_message(nid, 'bbbb', t=t.current))
+    ok_(logic.queue_depth(nid) == (2, 8))
+    just_(logic.send_message(nid, 'ccccc', t=t.current))
+    ok_(logic.queue_depth(nid) == (2, 9))
+    just_(logic.send_message(nid, 'd' * 11, t=t.current))  # would never fit
+    ok_(logic.queue_depth(nid) == (2, 9))
+    emits_(logic.heartbeat(t=t.advance(logic.heartbeat_max_silence)), [(Disconnect, nid2addr(nid)), (SendFailed, 'bbbb'), (SendFailed, 'ccccc'), (NodeDown, nid), (NextBeat, 1.0)])
+    ok_(logic.queue_depth(nid) == (0, 0))
+
+
 def test_send_message_with_an_existing_connection(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
     (t, logic), msg = test_successful_connect(t, logic, nid=nid), object()
     emits_(logic.send_message(nid, msg, t=t.current), [(Send, OUT, nid, ANY, msg)])
@@ -148,7 +283,7 @@ def test_receive_ping_with_no_prior_connection(t=Time, logic=DEFAULT_LOGIC, nid=
 
 def test_receive_message_with_no_prior_connection(t=Time, logic=DEFAULT_LOGIC, nid=NID('kaamel:123')):
     t, logic, msg = t(), logic(), object()
-    emits_(logic.message_received(IN, nid, 1, msg, t=t.current), [(Ping, IN, nid, 0), (Receive, nid, msg)])
+    emits_(logic.message_received(IN, nid, 1, msg, t=t.current), [(Ping, IN, nid, 0), (Receive, IN, nid, msg)])
     return t, logic
 
 
@@ -292,7 +427,7 @@ def test_relay_propagates_on_incoming_connection(t=Time, logic=RELAY_LOGIC, mous
 
 def test_relay_propagates_on_incoming_message(t=Time, logic=RELAY_LOGIC, mouse=NID('mouse:123')):
     t, logic, msg = t(), logic(), object()
-    emits_(logic.message_received(IN, mouse, 1, msg, t.current), [(RelaySigNew, IN, mouse), (Ping, IN, mouse, ANY), (Receive, mouse, msg)])
+    emits_(logic.message_received(IN, mouse, 1, msg, t.current), [(RelaySigNew, IN, mouse), (Ping, IN, mouse, ANY), (Receive, IN, mouse, msg)])
 
 
 def test_relay_propagates_on_outgoing_connection(t=Time, logic=RELAY_LOGIC, mouse=NID('mouse:123')):
@@ -377,7 +512,7 @@ def test_after_successful_relayed_connect_queue_is_sent_and_subsequent_sends_do_
 
 def test_relayed_message_received(t=Time, logic=DEFAULT_LOGIC, mouse=NID('mouse:456')):
     t, logic, msg = t(), logic(), object()
-    emits_(logic.relay_forwarded_received(mouse, msg), [(Receive, mouse, msg)])
+    emits_(logic.relay_forwarded_received(mouse, msg), [(Receive, None, mouse, msg)])
     return t, logic
 
 